@@ -61,7 +61,13 @@ fi
 
 IMAGE_TAG=$(date '+%m%d%H%M%S')
 
-az acr build --subscription ${AZURE_SUBSCRIPTION_ID} --registry ${AZURE_CONTAINER_REGISTRY_NAME} --image $SERVICE_NAME:$IMAGE_TAG ./src/$SERVICE_NAME
+# these Dockerfiles copy the shared modules from src, the others build in their own folder
+case "$SERVICE_NAME" in
+    lg-agents-01-coding|lg-agents-02-shop|lc-react-tools) BUILD_CONTEXT="./src" ;;
+    *) BUILD_CONTEXT="./src/$SERVICE_NAME" ;;
+esac
+
+az acr build --subscription ${AZURE_SUBSCRIPTION_ID} --registry ${AZURE_CONTAINER_REGISTRY_NAME} --image $SERVICE_NAME:$IMAGE_TAG --file ./src/$SERVICE_NAME/Dockerfile $BUILD_CONTEXT
 IMAGE_NAME="${AZURE_CONTAINER_REGISTRY_NAME}.azurecr.io/$SERVICE_NAME:$IMAGE_TAG"
 
 echo "deploying image: $IMAGE_NAME"
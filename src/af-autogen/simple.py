@@ -1,5 +1,6 @@
 import dotenv
 import os
+import sys
 import asyncio
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.messages import TextMessage
@@ -11,10 +12,14 @@ from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from azure.ai.projects import AIProjectClient
 from azure.ai.projects.models import BingGroundingTool
 
+# the shared client factory lives next to the samples in src/shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import llm_clients
+
 dotenv.load_dotenv()
 
 # Create the token provider
-token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
+token_provider = llm_clients.token_provider()
 
 az_model_client = AzureOpenAIChatCompletionClient(
     azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
@@ -23,6 +28,8 @@ az_model_client = AzureOpenAIChatCompletionClient(
     azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
     azure_ad_token_provider=token_provider,  # Optional if you choose key-based authentication.
     # api_key="sk-...", # For key-based authentication.
+    http_client=llm_clients.async_http_client(), # pooled connections shared by all agents
+    max_retries=llm_clients.sdk_max_retries(),
 )
 
 async def web_ai_agent(query: str) -> str:
@@ -1,9 +1,12 @@
 import os
 import random
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
 import pytz
 from datetime import datetime
 import dotenv
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 import streamlit as st
 from langchain import agents
 from langchain_core.prompts import PromptTemplate
@@ -15,6 +18,10 @@ from langchain_community.callbacks.streamlit import (
     StreamlitCallbackHandler,
 )
 
+# the shared client factory lives next to the samples in src/shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import llm_clients
+
 dotenv.load_dotenv()
 
 st.set_page_config(
@@ -32,28 +39,29 @@ if "session_id" not in st.session_state:
     print("started new session: " + st.session_state["session_id"])
     st.write("You are running in session: " + st.session_state["session_id"])
 
-llm: AzureChatOpenAI = None
-if "AZURE_OPENAI_API_KEY" in os.environ:
-    llm = AzureChatOpenAI(
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
-        openai_api_version=os.getenv("AZURE_OPENAI_VERSION"),
-        temperature=0,
-        streaming=True
-    )
-else:
-    token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
+@contextmanager
+def timed(timings: Dict[str, float], phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = time.perf_counter() - started
+
+def create_llm() -> AzureChatOpenAI:
+    # the HTTP clients are shared by the whole process, connections are kept alive between turns
     llm = AzureChatOpenAI(
-        azure_ad_token_provider=token_provider,
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
         openai_api_version=os.getenv("AZURE_OPENAI_VERSION"),
         temperature=0,
-        openai_api_type="azure_ad",
-        streaming=True
+        streaming=True,
+        http_client=llm_clients.http_client(),
+        max_retries=llm_clients.sdk_max_retries(),
+        http_async_client=llm_clients.async_http_client(),
+        **llm_clients.azure_openai_credentials(),
     )
-    
+    return llm
+
 @tool
 def get_current_username(input: str) -> str:
     "Get the username of the current user."
@@ -128,14 +136,24 @@ Question: {input}
 Thought:{agent_scratchpad}
 
 """
-prompt = PromptTemplate.from_template(promptString)
-
-agent = create_react_agent(llm, tools, prompt)
-
-agent_executor = agents.AgentExecutor(
-        name="Tools Agent",
-        agent=agent, tools=tools,  verbose=True, handle_parsing_errors=True, max_iterations=10, return_intermediate_steps=True,
-    )
+# the client, the prompt and the agent are built once per process, not on every rerun
+@st.cache_resource
+def init_agent() -> agents.AgentExecutor:
+    timings: Dict[str, float] = {}
+    with timed(timings, "llm"):
+        llm = create_llm()
+    with timed(timings, "agent"):
+        prompt = PromptTemplate.from_template(promptString)
+        agent = create_react_agent(llm, tools, prompt)
+        agent_executor = agents.AgentExecutor(
+                name="Tools Agent",
+                agent=agent, tools=tools,  verbose=True, handle_parsing_errors=True, max_iterations=10, return_intermediate_steps=True,
+            )
+    phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items())
+    print(f"startup: {phases}, total {sum(timings.values()):.2f}s")
+    return agent_executor
+
+agent_executor = init_agent()
 
 if prompt := st.chat_input():
 
@@ -1,10 +1,15 @@
 import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator
 import dotenv
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 import streamlit as st
 import random
 from langchain_openai import AzureChatOpenAI
 from pydantic import BaseModel, Field
+from langgraph.graph.state import CompiledStateGraph
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from langchain_core.messages import BaseMessage, SystemMessage
 
@@ -18,6 +23,15 @@ from opentelemetry.sdk import trace as trace_sdk
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 
+from code_edits import extract_code
+from coding_graph import build_workflow
+from sandbox import Sandbox
+from static_checks import StaticChecker
+
+# the shared client factory lives next to the samples in src/shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import llm_clients
+
 dotenv.load_dotenv()
 
 st.title("💬 AI agentic code reviewer")
@@ -47,38 +61,36 @@ def create_session(st: st) -> None:
         print("started new session: " + st.session_state["session_id"])
         st.write("You are running in session: " + st.session_state["session_id"])
 
-tracer = setup_tracing()
 create_session(st)
 
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 
-model: AzureChatOpenAI = None
-if "AZURE_OPENAI_API_KEY" in os.environ:
-    model = AzureChatOpenAI(
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
-        openai_api_version=os.getenv("AZURE_OPENAI_VERSION"),
-        temperature=0,
-        streaming=False
-    )
-else:
-    token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
+def create_model() -> AzureChatOpenAI:
+    # the HTTP clients are shared by the whole process, connections are kept alive between turns
     model = AzureChatOpenAI(
-        azure_ad_token_provider=token_provider,
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
         openai_api_version=os.getenv("AZURE_OPENAI_VERSION"),
         temperature=0,
-        openai_api_type="azure_ad",
-        streaming=False
+        streaming=False,
+        http_client=llm_clients.http_client(),
+        max_retries=llm_clients.sdk_max_retries(),
+        http_async_client=llm_clients.async_http_client(),
+        **llm_clients.azure_openai_credentials(),
     )
+    return model
 
 
 def llm(x):
     return model.invoke(x).content
 
+def complete(model: AzureChatOpenAI, priority: int) -> Callable[[str], str]:
+    def call(prompt: str) -> str:
+        with llm_clients.llm_priority(priority):
+            return model.invoke(prompt).content
+    return call
+
 class Statement(BaseModel):
     response: str = Field(
         ...,
@@ -106,110 +118,47 @@ if "session_id" not in st.session_state:
     print("started new session: " + st.session_state["session_id"])
     st.write("You are running in session: " + st.session_state["session_id"])
 
-from typing import Dict, TypedDict, Optional
-from langgraph.graph import StateGraph, END
-from langgraph.graph.message import add_messages
-import random
-from typing import Annotated, Sequence, TypedDict
-
-class GraphState(TypedDict):
-    objective: Optional[str] = None
-    feedback: Optional[str] = None
-    history: Optional[str] = None
-    code: Optional[str] = None
-    specialization: Optional[str]=None
-    rating: Optional[str] = None
-    iterations: Optional[int]=None
-    code_compare: Optional[str]=None
-    actual_code: Optional[str]=None
-    messages: Annotated[Sequence[BaseMessage], add_messages] = []
-
-workflow = StateGraph(GraphState)
-
-### Nodes
-
-reviewer_start= "You are Code reviewer specialized in {}.\
-You need to review the given code following PEP8 guidelines and potential bugs\
-and point out issues as bullet list.\
-Code:\n {}"
-
-def handle_reviewer(state):
-    history = state.get('history', '').strip()
-    code = state.get('code', '').strip()
-    specialization = state.get('specialization','').strip()
-    iterations = state.get('iterations')
-    messages = state.get('messages')
-    print("Reviewer working...")
-    
-    feedback = llm(reviewer_start.format(specialization,code))
-    messages.append(AIMessage(content="Reviewer: " + feedback))
-
-    return {'history':history+"\n REVIEWER:\n"+feedback,'feedback':feedback,'iterations':iterations+1, 'messages':messages}
-
-coder_start = "You are a Coder specialized in {}.\
-Improve the given code given the following guidelines. Guideline:\n {} \n \
-Code:\n {} \n \
-Output just the improved code and nothing else."
-def handle_coder(state):
-    history = state.get('history', '').strip()
-    feedback = state.get('feedback', '').strip()
-    code =  state.get('code','').strip()
-    specialization = state.get('specialization','').strip()
-    messages = state.get('messages')
-    print("CODER rewriting...")
-    
-    code = llm(coder_start.format(specialization,feedback,code))
-    messages.append(AIMessage(content="Coder: " + code))
-    return {'history':history+'\n CODER:\n'+code,'code':code, 'messages':messages}
-
-rating_start = "Rate the skills of the coder on a scale of 10 given the Code review cycle with a short reason.\
-Code review:\n {} \n "
-
-code_comparison = "Compare the two code snippets and rate on a scale of 10 to both. Dont output the codes.Revised Code: \n {} \n Actual Code: \n {}"
-
-def handle_result(state):
-    print("Review done...")
-    messages = state.get('messages')
-    history = state.get('history', '').strip()
-    code1 = state.get('code', '').strip()
-    code2 = state.get('actual_code', '').strip()
-    rating  = llm(rating_start.format(history))
-    
-    code_compare = llm(code_comparison.format(code1,code2))
-    messages.append(AIMessage(content="Result: " + code_compare))
-    messages.append(AIMessage(content="Code: " + code2))
-
-    return {'rating':rating,'code_compare':code_compare, 'messages':messages}
-
-# Define the nodes we will cycle between
-workflow.add_node("handle_reviewer",handle_reviewer)
-workflow.add_node("handle_coder",handle_coder)
-workflow.add_node("handle_result",handle_result)
-
-classify_feedback = "Are all feedback mentioned resolved in the code? Output just Yes or No.\
-Code: \n {} \n Feedback: \n {} \n"
-def deployment_ready(state):
-    deployment_ready = 1 if 'yes' in llm(classify_feedback.format(state.get('code'),state.get('feedback'))) else 0
-    total_iterations = 1 if state.get('iterations')>5 else 0
-    return "handle_result" if  deployment_ready or total_iterations else "handle_coder" 
-
-
-workflow.add_conditional_edges(
-    "handle_reviewer",
-    deployment_ready,
-    {
-        "handle_result": "handle_result",
-        "handle_coder": "handle_coder"
-    }
-)
-
-workflow.set_entry_point("handle_reviewer")
-workflow.add_edge('handle_coder', "handle_reviewer")
-workflow.add_edge('handle_result', END)
-
-# Compile
-
-app = workflow.compile()
+@dataclass
+class Resources:
+    tracer: trace.Tracer
+    model: AzureChatOpenAI
+    app: CompiledStateGraph
+    checker: StaticChecker
+    sandbox: Sandbox
+
+@contextmanager
+def timed(timings: Dict[str, float], phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = time.perf_counter() - started
+
+# tracing, the client and the compiled graph are built once per process, not on every rerun
+@st.cache_resource
+def init_resources() -> Resources:
+    timings: Dict[str, float] = {}
+    with timed(timings, "tracing"):
+        tracer = setup_tracing()
+    with timed(timings, "model"):
+        model = create_model()
+    with timed(timings, "static_checks"):
+        checker = StaticChecker()
+        checker.start()
+    with timed(timings, "sandbox"):
+        sandbox = Sandbox()
+        sandbox.start()
+    with timed(timings, "graph"):
+        # the ratings queue behind the coder and reviewer calls when the deployment is at its rate limit
+        app = build_workflow(complete(model, llm_clients.INTERACTIVE), complete(model, llm_clients.BACKGROUND), checker, sandbox).compile()
+    phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items())
+    print(f"startup: {phases}, total {sum(timings.values()):.2f}s")
+    return Resources(tracer, model, app, checker, sandbox)
+
+resources = init_resources()
+tracer = resources.tracer
+model = resources.model
+app = resources.app
 
 human_query = st.chat_input()
 
@@ -220,9 +169,10 @@ if human_query is not None and human_query != "":
     st.session_state.chat_history.append(HumanMessage(human_query))
 
     specialization = 'python'
-    code = llm(human_query)
+    # only the code block of the answer, the coder's diffs are applied to it
+    code = extract_code(llm(human_query))
 
-    inputs = {"objective": human_query, "history":code,"code":code,'actual_code':code,"specialization":specialization,'iterations':0}
+    inputs = {"objective": human_query, "code":code,'actual_code':code,"specialization":specialization,'iterations':0}
 
     config = {"recursion_limit":100}
 
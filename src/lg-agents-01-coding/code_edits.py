@@ -0,0 +1,109 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+FENCE = re.compile(r"```[\w+-]*\n(.*?)```", re.DOTALL)
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+
+class DiffError(ValueError):
+    pass
+
+
+@dataclass
+class Hunk:
+    start: int
+    lines: List[Tuple[str, str]]
+
+    @property
+    def before(self) -> List[str]:
+        return [text for kind, text in self.lines if kind != "+"]
+
+    @property
+    def after(self) -> List[str]:
+        return [text for kind, text in self.lines if kind != "-"]
+
+
+def extract_code(text: str) -> str:
+    """
+    The first fenced code block of an LLM answer, or the whole answer if it has none.
+    """
+    match = FENCE.search(text)
+    return (match.group(1) if match else text).strip("\n") + "\n"
+
+
+def extract_diff(text: str) -> str:
+    # LLMs like to wrap diffs in ```diff fences
+    for block in FENCE.findall(text):
+        if "@@" in block:
+            return block
+    return text
+
+
+def parse_hunks(diff: str) -> List[Hunk]:
+    hunks: List[Hunk] = []
+    for line in diff.splitlines():
+        header = HUNK_HEADER.match(line)
+        if header:
+            hunks.append(Hunk(int(header.group(1)), []))
+        elif not hunks or line.startswith(("---", "+++")) and not hunks[-1].lines:
+            continue
+        elif line.startswith(("+", "-", " ")):
+            hunks[-1].lines.append((line[0], line[1:]))
+        elif line == "":
+            # blank context lines often lose their leading space
+            hunks[-1].lines.append((" ", ""))
+        elif line.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+    return hunks
+
+
+def _find(lines: List[str], block: List[str], hint: int, start: int) -> Optional[int]:
+    if not block:
+        return min(max(hint, start), len(lines))
+    candidates = range(start, len(lines) - len(block) + 1)
+    # the hunk header is only a hint, LLMs get line numbers wrong but context right
+    for compare in (lambda line: line, lambda line: line.rstrip(), lambda line: line.strip()):
+        wanted = [compare(line) for line in block]
+        matches = [index for index in candidates if [compare(line) for line in lines[index:index + len(block)]] == wanted]
+        if matches:
+            return min(matches, key=lambda index: abs(index - hint))
+    return None
+
+
+def apply_diff(code: str, diff: str) -> str:
+    """
+    Applies a unified diff to `code`. Hunks are located by their context and removed lines,
+    closest to the line number of their header, so slightly wrong headers still apply.
+    """
+    hunks = parse_hunks(extract_diff(diff))
+    if not hunks:
+        raise DiffError("the answer contains no @@ hunks")
+    lines = code.splitlines()
+    offset, position = 0, 0
+    for number, hunk in enumerate(hunks, start=1):
+        index = _find(lines, hunk.before, hunk.start - 1 + offset, position)
+        if index is None:
+            raise DiffError(f"hunk {number} does not match the code: " + " / ".join(hunk.before[:3]))
+        # context lines keep the text of the code, the diff may have changed their whitespace
+        original = iter(lines[index:index + len(hunk.before)])
+        after: List[str] = []
+        for kind, text in hunk.lines:
+            if kind == "+":
+                after.append(text)
+            elif kind == " ":
+                after.append(next(original))
+            else:
+                next(original)
+        lines[index:index + len(hunk.before)] = after
+        offset += len(hunk.after) - len(hunk.before)
+        position = index + len(hunk.after)
+    return "\n".join(lines) + "\n"
+
+
+def diff_stats(diff: str) -> str:
+    hunks = parse_hunks(extract_diff(diff))
+    added = sum(1 for hunk in hunks for kind, _ in hunk.lines if kind == "+")
+    removed = sum(1 for hunk in hunks for kind, _ in hunk.lines if kind == "-")
+    return f"{len(hunks)} hunks, +{added} -{removed} lines"
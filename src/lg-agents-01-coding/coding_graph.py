@@ -0,0 +1,511 @@
+import contextvars
+import operator
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Annotated, Callable, Dict, List, Optional, Sequence, Set, Tuple, TypedDict
+
+import tiktoken
+from langchain_core.messages import AIMessage, BaseMessage
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+
+from code_edits import DiffError, apply_diff, diff_stats, extract_code, extract_diff
+from sandbox import Sandbox
+from static_checks import StaticChecker, analyze, fingerprint
+
+
+def update_reviews(left: Optional[Dict[str, Dict]], right: Dict[str, Dict]) -> Dict[str, Dict]:
+    # the reviewers run in parallel, each one replaces only its own entry
+    return {**(left or {}), **right}
+
+
+class GraphState(TypedDict):
+    objective: Optional[str] = None
+    feedback: Optional[str] = None
+    code: Optional[str] = None
+    specialization: Optional[str]=None
+    rating: Optional[str] = None
+    iterations: Optional[int]=None
+    code_compare: Optional[str]=None
+    actual_code: Optional[str]=None
+    messages: Annotated[Sequence[BaseMessage], add_messages] = []
+    # open review issues, the reviewer checks them again and the coder resolves them
+    issues: Optional[List[str]] = None
+    # doctests written for the objective, and the outcome of the last sandbox run
+    tests: Optional[str] = None
+    execution: Optional[Dict] = None
+    # the latest issues of every specialist reviewer
+    reviews: Annotated[Dict[str, Dict], update_reviews] = {}
+    # what happened in each iteration, short entries instead of full code and feedback
+    transcript: Annotated[List[Dict], operator.add] = []
+    # prompt and completion tokens of every LLM call
+    usage: Annotated[List[Dict], operator.add] = []
+    # False if the reviewer answered without a bullet list, its issues cannot be counted then
+    structured: Optional[bool] = None
+    # fingerprints of the reviewed code, a repeated one means the loop stopped making progress
+    fingerprints: Annotated[List[str], operator.add] = []
+    # whether the review loop is done, and who decided it
+    ready: Optional[bool] = None
+    # the coder's rewrite started while the LLM classifier was still deciding
+    speculation: Optional[Dict] = None
+    # the key of a speculative rewrite that was no longer needed but had already called the LLM,
+    # the rewrite itself waits in a map outside the state, which only holds plain data
+    discarded: Optional[str] = None
+    decisions: Annotated[List[Dict], operator.add] = []
+
+
+reviewer_start= "You are a {} code reviewer specialized in {}.\
+You need to review the given code only for {}\
+and point out issues as bullet list, one issue per bullet. Answer 'No issues' if there are none.\
+{}Code:\n {}"
+
+# the specialist reviewers, in the order their issues are ranked when as many reviewers raised them
+REVIEWERS = {
+    "correctness": "bugs, wrong results, unhandled edge cases and error handling",
+    "security": "injection, unsafe use of eval, exec, subprocess or pickle, secrets in the code and unvalidated input",
+    "performance": "needless work in loops, unsuitable data structures and algorithmic complexity",
+    "style": "PEP8 guidelines, naming, docstrings and readability",
+}
+
+reviewer_previous = "These issues were raised in the last review, list again only those that are still present:\n{}\n"
+
+coder_start = "You are a Coder specialized in {}.\
+Improve the given code given the following guidelines. Guideline:\n {} \n \
+Code (code.py):\n {} \n \
+The code is imported as a module with an empty stdin, an `if __name__ == '__main__':` block does not run \
+and examples in its docstrings are run as doctests.\
+{}Output just a unified diff against code.py (--- a/code.py, +++ b/code.py, @@ hunks with 3 lines of context) and nothing else."
+
+coder_retry = "Your last diff could not be applied ({}). Copy the context lines exactly from the code above.\n"
+
+rating_start = "Rate the skills of the coder on a scale of 10 given the Code review cycle with a short reason.\
+Code review:\n {} \n Final code:\n {} \n "
+
+code_comparison = "Compare the two code snippets and rate on a scale of 10 to both. Dont output the codes.Revised Code: \n {} \n Actual Code: \n {}"
+
+tests_start = "Write doctests that check whether the code does what the objective asks for.\
+Only call functions and classes the code defines, do not rely on reading stdin, and output nothing but the doctest lines (>>> and expected output).\
+Objective:\n {} \n Code:\n {} \n"
+
+classify_feedback = "Are all feedback mentioned resolved in the code? Output just Yes or No.\
+Code: \n {} \n Feedback: \n {} \n"
+
+encoding = tiktoken.get_encoding("cl100k_base")
+
+BULLET = re.compile(r"^\s*(?:[-*\u2022]|\d+[.)])\s+(.*)$")
+WORD = re.compile(r"[a-z0-9_]+")
+
+
+def count_tokens(text: str) -> int:
+    return len(encoding.encode(text))
+
+
+def bullets(feedback: str) -> List[str]:
+    return [match.group(1).strip() for match in map(BULLET.match, feedback.splitlines()) if match]
+
+
+def parse_issues(feedback: str) -> List[str]:
+    issues = bullets(feedback)
+    if issues:
+        return issues
+    return [] if "no issues" in feedback.lower() else [feedback.strip()]
+
+
+def bullet_list(issues: List[str]) -> str:
+    return "\n".join("- " + issue for issue in issues)
+
+
+def words(text: str) -> Set[str]:
+    return set(WORD.findall(text.lower()))
+
+
+def rank_issues(reviews: Dict[str, Dict], order: List[str], limit: int, similarity: float = 0.75) -> List[Tuple[str, List[str]]]:
+    """
+    The issues of all reviewers with near duplicates merged, two issues are the same if most
+    words of the shorter one appear in the other. Issues raised by
+    more reviewers come first, then those of reviewers earlier in `order`.
+    """
+    merged: List[Tuple[str, List[str], Set[str]]] = []
+    for name in order:
+        for issue in reviews.get(name, {}).get("issues", []):
+            issue_words = words(issue)
+            for _, names, known in merged:
+                if len(issue_words & known) >= similarity * min(len(issue_words), len(known)):
+                    names.append(name)
+                    known |= issue_words
+                    break
+            else:
+                merged.append((issue, [name], issue_words))
+    merged.sort(key=lambda entry: -len(entry[1]))
+    return [(issue, names) for issue, names, _ in merged[:limit]]
+
+
+def render_transcript(transcript: List[Dict], max_tokens: int) -> str:
+    """
+    The newest transcript entries that fit into `max_tokens`, older ones are only counted.
+    """
+    lines: List[str] = []
+    used = 0
+    for entry in reversed(transcript):
+        line = f"Iteration {entry['iteration']} {entry['role']}: {entry['text']}"
+        tokens = count_tokens(line)
+        if used + tokens > max_tokens:
+            break
+        lines.append(line)
+        used += tokens
+    omitted = len(transcript) - len(lines)
+    if omitted:
+        lines.append(f"({omitted} earlier entries omitted)")
+    return "\n".join(reversed(lines))
+
+
+def usage_report(usage: List[Dict]) -> str:
+    per_iteration: Dict[int, List[int]] = {}
+    for entry in usage:
+        totals = per_iteration.setdefault(entry["iteration"], [0, 0])
+        totals[0] += entry["prompt_tokens"]
+        totals[1] += entry["completion_tokens"]
+    return ", ".join(f"{iteration}: {prompt} prompt / {completion} completion" for iteration, (prompt, completion) in sorted(per_iteration.items()))
+
+
+def execution_findings(execution: Dict) -> List[str]:
+    if execution['error']:
+        return [f"running the code failed, {execution['error']}"]
+    findings = []
+    if execution['failed']:
+        findings.append(f"{execution['failed']} of {execution['attempted']} tests failed:\n{execution['failures'].strip()}")
+    if execution.get('examples_failed'):
+        # the examples are written by the coder, they can be as wrong as the code
+        findings.append(
+            f"{execution['examples_failed']} of {execution['examples_attempted']} examples in the docstrings do not match "
+            f"what the code returns, correct the examples or the code:\n{execution['examples_failures'].strip()}"
+        )
+    return findings
+
+
+def execution_report(execution: Optional[Dict]) -> str:
+    if execution is None:
+        return "the sandbox is not available"
+    if execution['error']:
+        report = "failed, " + execution['error']
+    else:
+        report = f"{execution['attempted'] - execution['failed']} of {execution['attempted']} tests passed"
+        if execution.get('examples_attempted'):
+            report += f", {execution['examples_attempted'] - execution['examples_failed']} of {execution['examples_attempted']} docstring examples"
+    if execution['tests_error']:
+        report += ", the generated tests could not be parsed: " + execution['tests_error']
+    return report + f" in {execution['seconds']}s"
+
+
+def decision_report(decisions: List[Dict]) -> str:
+    local = sum(1 for decision in decisions if decision["by"] == "local")
+    report = f"{local} decided by the local checks, {len(decisions) - local} by the LLM classifier"
+    speculated = [decision for decision in decisions if decision.get("speculated")]
+    if speculated:
+        report += f", {sum(1 for decision in speculated if decision['used'])} of {len(speculated)} speculative rewrites used"
+    return report
+
+
+class SpeculationStats:
+    """
+    How often the speculative coder's rewrite was used, and the tokens spent on the discarded
+    ones, over all sessions of the process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.discarded_tokens = 0
+
+    def record(self, used: bool) -> None:
+        with self._lock:
+            self.started += 1
+            self.used += used
+
+    def discard(self, usage: List[Dict]) -> None:
+        with self._lock:
+            self.discarded_tokens += sum(entry["prompt_tokens"] + entry["completion_tokens"] for entry in usage)
+
+    def report(self) -> str:
+        with self._lock:
+            if not self.started:
+                return "no speculative rewrites yet"
+            return f"{self.used} of {self.started} speculative rewrites used ({self.used / self.started:.0%}), {self.discarded_tokens} tokens discarded"
+
+
+def build_workflow(
+    llm: Callable[[str], str],
+    score: Optional[Callable[[str], str]] = None,
+    checker: Optional[StaticChecker] = None,
+    sandbox: Optional[Sandbox] = None,
+) -> StateGraph:
+    """
+    Builds the coder and reviewer loop around `llm`, which takes a prompt and returns the
+    completion text. `score` runs the final ratings, it defaults to `llm`. `checker` runs the
+    static checks in worker processes, without it they run in the graph's thread. With a
+    `sandbox` the code is also executed against generated doctests in every review round.
+    """
+    score = score or llm
+    check = checker.check if checker is not None else analyze
+    # CODING_REVIEWERS picks the specialist reviewers that run in parallel on every review round
+    reviewers = [name.strip() for name in os.getenv("CODING_REVIEWERS", ",".join(REVIEWERS)).split(",") if name.strip() in REVIEWERS] or list(REVIEWERS)
+    # CODING_REVIEW_MAX_ISSUES caps the merged issues the coder gets in one round
+    max_issues = int(os.getenv("CODING_REVIEW_MAX_ISSUES", "10"))
+    # CODING_GENERATE_TESTS=false only runs the code and the doctests it already has
+    generate_tests = os.getenv("CODING_GENERATE_TESTS", "true").lower() == "true"
+    # CODING_SPECULATIVE_CODER=false waits for the LLM classifier before the coder starts
+    speculative = os.getenv("CODING_SPECULATIVE_CODER", "true").lower() == "true"
+    speculation_stats = SpeculationStats()
+    speculation_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-coder")
+    # discarded rewrites still running, by the key kept in the state until handle_result collects them
+    discarded_rewrites: Dict[str, Future] = {}
+    discarded_lock = threading.Lock()
+    # CODING_TRANSCRIPT_TOKENS caps the review transcript that is sent to the rating prompt
+    transcript_tokens = int(os.getenv("CODING_TRANSCRIPT_TOKENS", "1500"))
+    workflow = StateGraph(GraphState)
+
+    def call(complete: Callable[[str], str], node: str, iteration: int, prompt: str) -> Tuple[str, Dict]:
+        started = time.perf_counter()
+        answer = complete(prompt)
+        usage = {"node": node, "iteration": iteration, "prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(answer),
+                 "seconds": time.perf_counter() - started}
+        print(f"{node} iteration {iteration}: {usage['prompt_tokens']} prompt tokens, {usage['completion_tokens']} completion tokens")
+        return answer, usage
+
+    ### Nodes
+
+    def reviewer(name: str):
+        def review(state):
+            code = state.get('code', '').strip()
+            specialization = state.get('specialization','').strip()
+            iterations = state.get('iterations')
+            # the current code and the issues this reviewer raised last time, not the whole exchange so far
+            issues = (state.get('reviews') or {}).get(name, {}).get('issues') or []
+            print(f"{name} reviewer working...")
+
+            previous = reviewer_previous.format(bullet_list(issues)) if issues else ""
+            feedback, usage = call(llm, f"reviewer {name}", iterations + 1, reviewer_start.format(name, specialization, REVIEWERS[name], previous, code))
+            issues = parse_issues(feedback)
+            # the merged list is posted by handle_reviewer, the app expects a messages key from every node
+            return {'reviews':{name: {'issues':issues, 'structured':bool(bullets(feedback)) or not issues}}, 'messages':[], 'usage':[usage]}
+        return review
+
+    def handle_reviewer(state):
+        iterations = state.get('iterations')
+        reviews = state.get('reviews') or {}
+        messages = state.get('messages')
+
+        ranked = rank_issues(reviews, reviewers, max_issues)
+        issues = [issue for issue, _ in ranked]
+        # an unstructured answer of one reviewer makes the whole round inconclusive
+        structured = all(reviews[name]['structured'] for name in reviewers)
+        feedback = "\n".join(f"- [{', '.join(names)}] {issue}" for issue, names in ranked)
+        round_usage = [entry for entry in state.get('usage') or [] if entry['iteration'] == iterations + 1 and entry['node'].startswith("reviewer ")]
+        seconds = [entry['seconds'] for entry in round_usage]
+        print(f"{len(reviewers)} reviewers in parallel: {max(seconds, default=0):.2f}s, {sum(seconds):.2f}s one after the other")
+        messages.append(AIMessage(content="Reviewers: " + (feedback or "No issues")))
+
+        raised = sum(len(reviews[name]['issues']) for name in reviewers)
+        transcript = {'iteration': iterations + 1, 'role': 'reviewers', 'text': f"{len(issues)} issues: " + "; ".join(issues) if issues else "no issues"}
+        if raised > len(issues):
+            transcript['text'] += f" ({raised} raised)"
+        return {'feedback':feedback or 'No issues','issues':issues,'iterations':iterations+1, 'messages':messages,
+                'structured':structured, 'transcript':[transcript]}
+
+    def handle_execution(state):
+        code = state.get('code', '')
+        iterations = state.get('iterations')
+        tests = state.get('tests')
+        print("Executing code...")
+        result = {}
+        usage = []
+        if tests is None and generate_tests:
+            # written once for the objective, runs in parallel with the first review round
+            answer, entry = call(llm, "tests", iterations + 1, tests_start.format(state.get('objective'), code))
+            tests = extract_code(answer)
+            result['tests'] = tests
+            usage.append(entry)
+
+        execution = sandbox.run(code, tests or "")
+        print("execution: ", execution_report(execution))
+        result.update({'execution':execution, 'usage':usage, 'messages':[AIMessage(content="Execution: " + execution_report(execution))]})
+        return result
+
+    def check_convergence(state):
+        code = state.get('code', '')
+        iterations = state.get('iterations')
+        issues = state.get('issues') or []
+        messages = state.get('messages')
+        current = fingerprint(code)
+        # None if the checks timed out, then they give no signal
+        analysis = check(code)
+        findings = []
+        if analysis is not None:
+            findings = ([f"syntax error, {analysis['syntax_error']}"] if analysis['syntax_error'] else []) + analysis['errors']
+        # a syntax error already explains why the run failed
+        execution = state.get('execution')
+        if execution is not None and not (analysis and analysis['syntax_error']):
+            findings += execution_findings(execution)
+        result = {'fingerprints':[current]}
+
+        # the local signals first, the LLM classifier only when they do not settle it
+        usage = None
+        pending = None
+        if iterations > 5:
+            ready, reason = True, "iteration limit reached"
+        elif findings:
+            ready, reason = False, f"{len(findings)} errors found by the static checks and the test run"
+            issues = issues + [finding for finding in findings if finding not in issues]
+            result.update({'issues':issues, 'feedback':bullet_list(issues)})
+        elif current in (state.get('fingerprints') or []):
+            ready, reason = True, "the code did not change since the last review"
+        elif not issues and analysis is not None:
+            ready, reason = True, "no review issues and clean static checks"
+            if execution is not None:
+                reason += f", {execution['attempted']} tests passed"
+        elif issues and state.get('structured'):
+            ready, reason = False, f"{len(issues)} open review issues"
+        else:
+            # the coder starts right away, another round is likely when the review was not clean
+            cancelled = threading.Event()
+            pending = speculation_pool.submit(contextvars.copy_context().run, write_code, state, cancelled) if speculative else None
+            answer, usage = call(llm, "classifier", iterations, classify_feedback.format(code, state.get('feedback')))
+            ready, reason = 'yes' in answer.lower(), "LLM classifier answered " + answer.strip()
+            if pending is not None:
+                if ready:
+                    # the rewrite stops before its next LLM call, a call already sent is counted by handle_result
+                    cancelled.set()
+                    if not pending.cancel():
+                        key = uuid.uuid4().hex
+                        with discarded_lock:
+                            discarded_rewrites[key] = pending
+                        result['discarded'] = key
+                else:
+                    try:
+                        result['speculation'] = pending.result()
+                    except Exception as error:
+                        # handle_coder writes the code again
+                        print("speculative rewrite failed: ", error)
+                speculation_stats.record(used='speculation' in result)
+                print("speculative coder: ", speculation_stats.report())
+
+        by = "llm" if usage else "local"
+        print(f"convergence ({by}): {reason}")
+        if analysis is not None:
+            reason += f" ({len(analysis['warnings'])} pyflakes warnings, {len(analysis['style'])} style findings)"
+        messages.append(AIMessage(content="Convergence: " + reason))
+        decision = {'iteration': iterations, 'by': by, 'ready': ready, 'speculated': pending is not None, 'used': 'speculation' in result}
+        result.update({'ready':ready, 'messages':messages, 'decisions':[decision],
+                       'usage':[usage] if usage else []})
+        return result
+
+    def write_code(state, cancelled: Optional[threading.Event] = None) -> Optional[Dict]:
+        feedback = state.get('feedback', '').strip()
+        code =  state.get('code','')
+        specialization = state.get('specialization','').strip()
+        iterations = state.get('iterations')
+        print("CODER rewriting...")
+
+        retry = ""
+        usage = []
+        for attempt in range(2):
+            if cancelled is not None and cancelled.is_set():
+                # a speculative rewrite that is no longer needed, only the calls made so far are reported
+                return {'usage':usage}
+            # the coder answers with a diff, which is applied here instead of regenerating the whole file
+            diff, entry = call(llm, "coder", iterations, coder_start.format(specialization, feedback, code, retry))
+            usage.append(entry)
+            try:
+                code = apply_diff(code, diff)
+                break
+            except DiffError as error:
+                # `error` is unbound after the except block, the fallback below needs the message
+                last_error = str(error)
+                print("diff could not be applied: ", last_error)
+                retry = coder_retry.format(last_error)
+        else:
+            return {'message':"Coder: the changes could not be applied, keeping the code as it was", 'usage':usage,
+                    'transcript':[{'iteration': iterations, 'role': 'coder', 'text': 'diff did not apply: ' + last_error}]}
+
+        return {'code':code, 'message':"Coder: \n```diff\n" + extract_diff(diff).strip() + "\n```", 'usage':usage,
+                'transcript':[{'iteration': iterations, 'role': 'coder', 'text': diff_stats(diff)}]}
+
+    def handle_coder(state):
+        messages = state.get('messages')
+        # a rewrite is only kept in the state if it was written for this code and feedback
+        update = dict(state.get('speculation') or write_code(state))
+        messages.append(AIMessage(content=update.pop('message')))
+        return {**update, 'messages':messages, 'speculation':None}
+
+    def handle_result(state):
+        print("Review done...")
+        messages = state.get('messages')
+        code1 = state.get('code', '').strip()
+        code2 = state.get('actual_code', '').strip()
+        transcript = render_transcript(state.get('transcript') or [], transcript_tokens)
+        rating, rating_usage = call(score, "rating", state.get('iterations'), rating_start.format(transcript, code1))
+
+        code_compare, compare_usage = call(score, "comparison", state.get('iterations'), code_comparison.format(code1,code2))
+        # the discarded rewrite ran next to the classifier and the two calls above, it has usually finished by now
+        discarded = []
+        with discarded_lock:
+            pending = discarded_rewrites.pop(state.get('discarded') or '', None)
+        if pending is not None:
+            try:
+                discarded = [{**entry, 'node': "coder (discarded)"} for entry in pending.result()['usage']]
+            except Exception as error:
+                print("speculative rewrite failed: ", error)
+            speculation_stats.discard(discarded)
+        usage = state.get('usage', []) + [rating_usage, compare_usage] + discarded
+        messages.append(AIMessage(content="Result: " + code_compare))
+        # the coder only sent diffs, so the final code is shown once here
+        messages.append(AIMessage(content="Code: \n```python\n" + code1 + "\n```"))
+        messages.append(AIMessage(content="Tokens per iteration: " + usage_report(usage)))
+        report = decision_report(state.get('decisions') or [])
+        if discarded:
+            report += f", {sum(entry['prompt_tokens'] + entry['completion_tokens'] for entry in discarded)} tokens spent on the discarded one"
+        messages.append(AIMessage(content="Convergence checks: " + report))
+        print("speculative coder: ", speculation_stats.report())
+
+        return {'rating':rating,'code_compare':code_compare, 'messages':messages, 'usage':[rating_usage, compare_usage] + discarded}
+
+    # Define the nodes we will cycle between
+    for name in reviewers:
+        workflow.add_node(f"review_{name}", reviewer(name))
+    if sandbox is not None:
+        workflow.add_node("handle_execution",handle_execution)
+    workflow.add_node("handle_reviewer",handle_reviewer)
+    workflow.add_node("check_convergence",check_convergence)
+    workflow.add_node("handle_coder",handle_coder)
+    workflow.add_node("handle_result",handle_result)
+
+    def deployment_ready(state):
+        # decided by check_convergence, routers cannot record their decisions in the state
+        return "handle_result" if state.get('ready') else "handle_coder"
+
+    workflow.add_edge("handle_reviewer", "check_convergence")
+    workflow.add_conditional_edges(
+        "check_convergence",
+        deployment_ready,
+        {
+            "handle_result": "handle_result",
+            "handle_coder": "handle_coder"
+        }
+    )
+
+    # every review round fans out to the reviewers and the sandbox, handle_reviewer waits for all of them.
+    # The nodes are sync like the rest of the graph, LangGraph runs the branches of a step on its thread pool,
+    # and the LLM calls wait on the network there, so they overlap as async nodes would
+    branches = [f"review_{name}" for name in reviewers] + (["handle_execution"] if sandbox is not None else [])
+    for branch in branches:
+        workflow.add_edge(START, branch)
+        workflow.add_edge('handle_coder', branch)
+    workflow.add_edge(branches, "handle_reviewer")
+    workflow.add_edge('handle_result', END)
+
+    return workflow
@@ -0,0 +1,271 @@
+import doctest
+import io
+import json
+import math
+import os
+import pwd
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+import types
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the sandbox needs a POSIX system
+    resource = None
+
+from worker_pool import WorkerError, WorkerPool, serve
+
+# output and test failures are cut to this many characters, they end up in the coder's prompt
+OUTPUT_LIMIT = 2000
+FILE_LIMIT = 10 * 1024 * 1024
+# the code is imported under this name, so its `if __name__ == "__main__":` block does not run
+MODULE_NAME = "solution"
+DOCTEST_FLAGS = doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+# the only variables the workers get, the app's keys and connection strings stay out of reach of the code
+WORKER_ENVIRONMENT = ("PATH", "LANG", "PYTHONPATH")
+
+
+def _drop_privileges(user: str) -> None:
+    # the app runs as root in the container, where the process limit below does not apply
+    if os.getuid() != 0:
+        return
+    account = pwd.getpwnam(user)
+    os.setgroups([])
+    os.setgid(account.pw_gid)
+    os.setuid(account.pw_uid)
+
+
+def _limit(timeout: float, memory_mb: int) -> None:
+    limits = [
+        (resource.RLIMIT_CPU, math.ceil(timeout) + 1),
+        (resource.RLIMIT_AS, memory_mb * 1024 * 1024),
+        (resource.RLIMIT_FSIZE, FILE_LIMIT),
+        (resource.RLIMIT_NOFILE, 64),
+        # no new processes, enforced because the child no longer runs as root
+        (resource.RLIMIT_NPROC, 0),
+    ]
+    for kind, value in limits:
+        resource.setrlimit(kind, (value, value))
+
+
+def _describe(error: BaseException) -> str:
+    # the line in the generated code, not in the sandbox
+    frames = [frame for frame in traceback.extract_tb(error.__traceback__) if frame.filename == "code.py"]
+    where = f"line {frames[-1].lineno}: " if frames else ""
+    description = where + "".join(traceback.format_exception_only(type(error), error)).strip()
+    if isinstance(error, EOFError):
+        description += " (the code reads from stdin, which is empty when it runs)"
+    return description
+
+
+def _run_doctests(candidates: List[doctest.DocTest]) -> Tuple[int, int, str]:
+    report: List[str] = []
+    runner = doctest.DocTestRunner(optionflags=DOCTEST_FLAGS)
+    for test in candidates:
+        runner.run(test, out=report.append)
+    # without the separator lines doctest puts between failures, they only cost prompt tokens
+    failures = "".join(report).replace(doctest.DocTestRunner.DIVIDER + "\n", "")
+    return runner.tries, runner.failures, failures[:OUTPUT_LIMIT]
+
+
+def _run_tests(examples: List[doctest.Example], globs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # runs like doctest, but only records what each example printed or raised, the parent decides
+    outcomes = []
+    stdout = sys.stdout
+    for example in examples:
+        sys.stdout = captured = io.StringIO()
+        exception = None
+        try:
+            exec(compile(example.source, "tests", "single"), globs)
+        except BaseException as error:
+            exception = "".join(traceback.format_exception_only(type(error), error))
+        finally:
+            sys.stdout = stdout
+        outcomes.append({"got": captured.getvalue()[:OUTPUT_LIMIT], "exception": exception})
+    return outcomes
+
+
+def _check_tests(examples: List[doctest.Example], outcomes: List[Dict[str, Any]]) -> Tuple[int, int, str]:
+    """
+    Compares the outcomes reported by the child with the expected output parsed in the parent,
+    examples without an outcome count as failed.
+    """
+    checker = doctest.OutputChecker()
+    report: List[str] = []
+    for index, example in enumerate(examples):
+        outcome = outcomes[index] if index < len(outcomes) else {"got": "", "exception": "the example did not run\n"}
+        got = outcome["got"]
+        if outcome["exception"] is None:
+            passed = example.exc_msg is None and checker.check_output(example.want, got, DOCTEST_FLAGS)
+        else:
+            passed = example.exc_msg is not None and checker.check_output(example.exc_msg, outcome["exception"], DOCTEST_FLAGS)
+            got += "Traceback (most recent call last):\n    ...\n" + outcome["exception"]
+        if not passed:
+            source = "".join("    " + line + "\n" for line in example.source.splitlines())
+            report.append("Failed example:\n" + source + checker.output_difference(example, got, DOCTEST_FLAGS))
+    return len(examples), len(report), "".join(report)[:OUTPUT_LIMIT]
+
+
+def _empty_result() -> Dict[str, Any]:
+    return {"error": None, "attempted": 0, "failed": 0, "failures": "", "tests_error": None,
+            "examples_attempted": 0, "examples_failed": 0, "examples_failures": ""}
+
+
+def _execute(code: str, tests: List[doctest.Example]) -> Dict[str, Any]:
+    result = {"error": None, "outcomes": []}
+    module = types.ModuleType(MODULE_NAME)
+    # dataclasses and doctest look the code up in sys.modules
+    sys.modules[MODULE_NAME] = module
+    try:
+        exec(compile(code, "code.py", "exec"), module.__dict__)
+    except SystemExit as error:
+        if error.code not in (None, 0):
+            result["error"] = f"exited with {error.code}"
+    except BaseException as error:
+        result["error"] = _describe(error)
+    if result["error"]:
+        return result
+
+    # the generated tests check the objective, a failure there is a failure of the code
+    result["outcomes"] = _run_tests(tests, dict(module.__dict__))
+    # the examples the coder put into docstrings can be wrong themselves, they are reported apart
+    examples = doctest.DocTestFinder().find(module, MODULE_NAME)
+    result["examples_attempted"], result["examples_failed"], result["examples_failures"] = _run_doctests(examples)
+    return result
+
+
+def run(code: str, tests: str = "", timeout: float = 5.0, memory_mb: int = 256, user: str = "nobody") -> Dict[str, Any]:
+    """
+    Runs `code` and then `tests` and its own doctests in a child forked from this worker, as
+    `user` if the worker runs as root, with resource limits, no stdin and its own working
+    directory. Runs in the worker processes.
+
+    The code and the tests share the child, so whatever the child writes back could come from
+    the code. Only the printed output and exceptions of the tests are taken from it, and this
+    process compares them with the expected output it parsed itself.
+    """
+    started = time.perf_counter()
+    tests_error = None
+    try:
+        examples = doctest.DocTestParser().get_examples(tests)
+    except ValueError as error:
+        examples, tests_error = [], str(error)
+    workdir = tempfile.mkdtemp(prefix="sandbox-")
+    if os.getuid() == 0:
+        account = pwd.getpwnam(user)
+        os.chown(workdir, account.pw_uid, account.pw_gid)
+    with tempfile.TemporaryFile() as output, tempfile.TemporaryFile() as results:
+        pid = os.fork()
+        if pid == 0:
+            child = os.getpid()
+            try:
+                # a group of its own, so processes the code starts are killed with it
+                os.setpgid(0, 0)
+                os.chdir(workdir)
+                os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+                # the worker's stdin object may still hold buffered requests
+                sys.stdin = open(0, closefd=False)
+                # stdout is how this worker answers, the code must not write to it
+                os.dup2(output.fileno(), 1)
+                os.dup2(output.fileno(), 2)
+                # nothing the worker has open but the results file stays reachable, neither do its variables
+                os.closerange(3, results.fileno())
+                os.closerange(results.fileno() + 1, os.sysconf("SC_OPEN_MAX"))
+                os.environ.clear()
+                _drop_privileges(user)
+                _limit(timeout, memory_mb)
+                result = _execute(code, examples)
+                if os.getpid() == child:
+                    results.write(json.dumps(result).encode())
+                    results.flush()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(0)
+
+        timed_out = False
+        delay = 0.001
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                break
+            if time.perf_counter() - started > timeout:
+                os.kill(pid, signal.SIGKILL)
+                _, status = os.waitpid(pid, 0)
+                timed_out = True
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.02)
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+        results.seek(0)
+        answer = results.read()
+        output.seek(0)
+        printed = output.read(OUTPUT_LIMIT).decode(errors="replace")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    result = _empty_result()
+    try:
+        reported = json.loads(answer) if answer else None
+    except ValueError:
+        # the code wrote into the results file as well
+        reported = {"error": "the result of the run could not be read"}
+    if reported is not None:
+        result.update({key: reported[key] for key in ("error", "examples_attempted", "examples_failed", "examples_failures") if key in reported})
+        if not result["error"]:
+            result["attempted"], result["failed"], result["failures"] = _check_tests(examples, reported.get("outcomes") or [])
+    else:
+        if timed_out:
+            result["error"] = f"timed out after {timeout}s"
+        elif os.WIFSIGNALED(status):
+            # SIGXCPU for the CPU limit, SIGXFSZ for too much output
+            result["error"] = f"killed by {signal.Signals(os.WTERMSIG(status)).name}"
+        else:
+            result["error"] = f"crashed with exit code {os.WEXITSTATUS(status)}"
+    result["tests_error"] = tests_error
+    result.update({"passed": not result["error"] and not result["failed"], "output": printed,
+                   "seconds": round(time.perf_counter() - started, 3)})
+    return result
+
+
+class Sandbox:
+    """
+    Runs generated code in a pool of worker processes that are started with the app. Every
+    run forks a fresh child from a warm worker, which only costs a few milliseconds.
+    """
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None, memory_mb: Optional[int] = None):
+        self.timeout = timeout or float(os.getenv("CODING_SANDBOX_TIMEOUT", "5"))
+        self.memory_mb = memory_mb or int(os.getenv("CODING_SANDBOX_MEMORY_MB", "256"))
+        # the account the code runs as when the app runs as root
+        self.user = os.getenv("CODING_SANDBOX_USER", "nobody")
+        # the worker kills a run after `timeout`, the pool only waits longer in case the worker hangs
+        environment = {name: os.environ[name] for name in WORKER_ENVIRONMENT if name in os.environ}
+        self.pool = WorkerPool(os.path.abspath(__file__), workers or int(os.getenv("CODING_SANDBOX_WORKERS", "2")), self.timeout + 5,
+                               env=environment)
+
+    def start(self) -> None:
+        self.pool.start()
+
+    def run(self, code: str, tests: str = "") -> Optional[Dict[str, Any]]:
+        """
+        The outcome of running `code` and `tests`, or None if the sandbox itself failed.
+        """
+        try:
+            return self.pool.call({"code": code, "tests": tests, "timeout": self.timeout, "memory_mb": self.memory_mb, "user": self.user})
+        except WorkerError as error:
+            print("sandbox failed: ", error)
+            return None
+
+
+if __name__ == "__main__":
+    serve(run)
@@ -0,0 +1,101 @@
+import ast
+import hashlib
+import os
+from typing import Any, Dict, List, Optional
+
+from worker_pool import WorkerError, WorkerPool, serve
+
+try:
+    import pycodestyle
+except ImportError:
+    pycodestyle = None
+
+try:
+    from pyflakes.checker import Checker as FlakesChecker
+except ImportError:
+    FlakesChecker = None
+
+# pyflakes findings that make the code fail when it runs, everything else is a warning
+BLOCKING = {
+    "UndefinedName", "UndefinedLocal", "UndefinedExport", "DuplicateArgument", "ReturnOutsideFunction",
+    "YieldOutsideFunction", "ContinueOutsideLoop", "BreakOutsideLoop", "TwoStarredExpressions",
+    "DefaultExceptNotLast", "FutureFeatureNotDefined", "LateFutureImport", "ImportStarNotPermitted",
+}
+
+
+def fingerprint(code: str) -> str:
+    """
+    A hash of the code that ignores comments and formatting, equal fingerprints in two
+    iterations mean the coder did not change anything that matters.
+    """
+    try:
+        normalized = ast.dump(ast.parse(code))
+    except SyntaxError:
+        normalized = "\n".join(line.rstrip() for line in code.strip().splitlines())
+    return hashlib.sha256(normalized.encode()).hexdigest()[:16]
+
+
+def _style(code: str) -> List[str]:
+    if pycodestyle is None:
+        return []
+    findings: List[str] = []
+
+    class Report(pycodestyle.BaseReport):
+        def error(self, line_number, offset, text, check):
+            if super().error(line_number, offset, text, check):
+                findings.append(f"line {line_number}: {text}")
+
+    options = pycodestyle.StyleGuide(quiet=True, max_line_length=120).options
+    pycodestyle.Checker(lines=code.splitlines(True), options=options, report=Report(options)).check_all()
+    return findings
+
+
+def analyze(code: str) -> Dict[str, Any]:
+    """
+    Syntax, pyflakes and pycodestyle findings for `code`. Runs in the worker processes, so it
+    only takes and returns plain values.
+    """
+    result: Dict[str, Any] = {"fingerprint": fingerprint(code), "syntax_error": None, "errors": [], "warnings": [], "style": []}
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as error:
+        result["syntax_error"] = f"line {error.lineno}: {error.msg}"
+        return result
+    if FlakesChecker is not None:
+        for message in sorted(FlakesChecker(tree, filename="code.py").messages, key=lambda message: message.lineno):
+            finding = f"line {message.lineno}: " + message.message % message.message_args
+            result["errors" if type(message).__name__ in BLOCKING else "warnings"].append(finding)
+    result["style"] = _style(code)
+    return result
+
+
+class StaticChecker:
+    """
+    Runs `analyze` in a small pool of worker processes, so checking the code of one session
+    does not hold the interpreter lock for all the others served by the app.
+    """
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None):
+        self.pool = WorkerPool(
+            os.path.abspath(__file__),
+            workers or int(os.getenv("CODING_CHECK_WORKERS", "2")),
+            timeout or float(os.getenv("CODING_CHECK_TIMEOUT", "10")),
+        )
+
+    def start(self) -> None:
+        # starts the workers ahead of the first review
+        self.pool.start()
+
+    def check(self, code: str) -> Optional[Dict[str, Any]]:
+        """
+        The findings for `code`, or None if the check did not finish.
+        """
+        try:
+            return self.pool.call({"code": code})
+        except WorkerError as error:
+            print("static checks failed: ", error)
+            return None
+
+
+if __name__ == "__main__":
+    serve(analyze)
@@ -0,0 +1,53 @@
+import pytest
+
+from code_edits import DiffError, apply_diff, diff_stats, extract_code, extract_diff
+
+CODE = "def add(a, b):\n    return a - b\n\n\nprint(add(1, 2))\n"
+
+
+def test_apply_diff_replaces_the_hunk():
+    diff = "--- a/code.py\n+++ b/code.py\n@@ -1,2 +1,2 @@\n def add(a, b):\n-    return a - b\n+    return a + b\n"
+    assert apply_diff(CODE, diff) == CODE.replace("a - b", "a + b")
+
+
+def test_apply_diff_finds_hunks_with_wrong_line_numbers():
+    diff = "@@ -40,2 +40,2 @@\n def add(a, b):\n-    return a - b\n+    return a + b\n"
+    assert apply_diff(CODE, diff) == CODE.replace("a - b", "a + b")
+
+
+def test_apply_diff_ignores_trailing_whitespace_in_context():
+    diff = "@@ -1,2 +1,2 @@\n def add(a, b):   \n-    return a - b\n+    return a + b\n"
+    assert apply_diff(CODE, diff) == CODE.replace("a - b", "a + b")
+
+
+def test_apply_diff_applies_several_hunks_in_order():
+    diff = (
+        "@@ -1,2 +1,3 @@\n def add(a, b):\n+    \"\"\"Adds.\"\"\"\n     return a - b\n"
+        "@@ -5 +6 @@\n-print(add(1, 2))\n+print(add(2, 2))\n"
+    )
+    assert apply_diff(CODE, diff) == 'def add(a, b):\n    """Adds."""\n    return a - b\n\n\nprint(add(2, 2))\n'
+
+
+def test_apply_diff_reads_fenced_answers():
+    answer = "Here you go:\n```diff\n@@ -2 +2 @@\n-    return a - b\n+    return a + b\n```\n"
+    assert apply_diff(CODE, answer) == CODE.replace("a - b", "a + b")
+
+
+def test_apply_diff_rejects_context_that_is_not_in_the_code():
+    with pytest.raises(DiffError):
+        apply_diff(CODE, "@@ -1 +1 @@\n-def sub(a, b):\n+def add(a, b):\n")
+
+
+def test_apply_diff_rejects_answers_without_hunks():
+    with pytest.raises(DiffError):
+        apply_diff(CODE, "def add(a, b):\n    return a + b\n")
+
+
+def test_extract_code_and_diff():
+    assert extract_code("text\n```python\nx = 1\n```\nmore") == "x = 1\n"
+    assert extract_code("x = 1") == "x = 1\n"
+    assert extract_diff("```python\nx\n```\n```diff\n@@ -1 +1 @@\n-x\n+y\n```") == "@@ -1 +1 @@\n-x\n+y\n"
+
+
+def test_diff_stats():
+    assert diff_stats("@@ -1 +1,2 @@\n-x\n+y\n+z\n") == "1 hunks, +2 -1 lines"
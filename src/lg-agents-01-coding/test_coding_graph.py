@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from coding_graph import build_workflow
+
+CODE = "def add(a, b):\n    return a + b\n\n\nprint(add(1, 2))\n"
+
+
+def run(llm, code=CODE, checkpointer=None):
+    app = build_workflow(llm).compile(checkpointer=checkpointer)
+    inputs = {"objective": "add two numbers", "code": code, "actual_code": code, "specialization": "python", "iterations": 0}
+    return app.invoke(inputs, {"recursion_limit": 100, "configurable": {"thread_id": "test"}})
+
+
+def test_coder_keeps_the_code_when_no_diff_applies(monkeypatch):
+    monkeypatch.setenv("CODING_REVIEWERS", "style")
+    prompts = []
+
+    def llm(prompt):
+        prompts.append(prompt)
+        if "code reviewer" in prompt:
+            return "- add a docstring"
+        if prompt.startswith("You are a Coder"):
+            return "@@ -1 +1 @@\n-def sub(a, b):\n+def add(a, b):\n"
+        return "8/10"
+
+    final = run(llm)
+    assert final["code"] == CODE
+    assert sum(prompt.startswith("You are a Coder") for prompt in prompts) == 2
+    coder = [entry for entry in final["transcript"] if entry["role"] == "coder"]
+    assert coder[0]["text"].startswith("diff did not apply: hunk 1 does not match the code")
+    assert any("could not be applied" in message.content for message in final["messages"])
+
+
+def test_loop_ends_locally_when_the_review_is_clean(monkeypatch):
+    monkeypatch.setenv("CODING_REVIEWERS", "correctness,style")
+
+    def llm(prompt):
+        assert not prompt.startswith("Are all feedback"), "the LLM classifier should not be asked"
+        return "No issues" if "code reviewer" in prompt else "8/10"
+
+    final = run(llm)
+    assert final["iterations"] == 1
+    assert final["decisions"] == [{"iteration": 1, "by": "local", "ready": True, "speculated": False, "used": False}]
+
+
+def test_static_errors_go_back_to_the_coder(monkeypatch):
+    monkeypatch.setenv("CODING_REVIEWERS", "style")
+    feedback = []
+
+    def llm(prompt):
+        if "code reviewer" in prompt:
+            return "No issues"
+        if prompt.startswith("You are a Coder"):
+            feedback.append(prompt)
+            return "@@ -2 +2 @@\n-    return a + c\n+    return a + b\n"
+        return "8/10"
+
+    final = run(llm, CODE.replace("a + b", "a + c"))
+    assert final["code"] == CODE
+    assert "undefined name 'c'" in feedback[0]
+    assert [decision["ready"] for decision in final["decisions"]] == [False, True]
+
+
+def test_discarded_speculative_rewrite_is_reported(monkeypatch):
+    monkeypatch.setenv("CODING_REVIEWERS", "style")
+    monkeypatch.setenv("CODING_SPECULATIVE_CODER", "true")
+    coder_started = threading.Event()
+    classified = threading.Event()
+    coder_calls = []
+
+    def llm(prompt):
+        if "code reviewer" in prompt:
+            # no bullet list, so the local checks leave the decision to the classifier
+            return "The function could use a docstring."
+        if prompt.startswith("You are a Coder"):
+            coder_calls.append(prompt)
+            coder_started.set()
+            # answers after the classifier, like a coder that writes more than a yes or no
+            assert classified.wait(5)
+            time.sleep(0.2)
+            return "@@ -1 +1 @@\n-def sub(a, b):\n+def add(a, b):\n"
+        if prompt.startswith("Are all feedback"):
+            assert coder_started.wait(5)
+            classified.set()
+            return "Yes"
+        return "8/10"
+
+    # the state is checkpointed after every step, so it may only hold plain data
+    final = run(llm, checkpointer=MemorySaver())
+    assert final["code"] == CODE
+    # the first attempt was already sent, the retry was cancelled
+    assert len(coder_calls) == 1
+    assert [entry["node"] for entry in final["usage"]].count("coder (discarded)") == 1
+    assert final["decisions"][-1] == {"iteration": 1, "by": "llm", "ready": True, "speculated": True, "used": False}
+    assert "tokens spent on the discarded one" in final["messages"][-1].content
@@ -0,0 +1,60 @@
+import sys
+
+import pytest
+
+if sys.platform == "win32":
+    pytest.skip("the sandbox needs a POSIX system", allow_module_level=True)
+
+from sandbox import run
+
+
+def test_main_block_does_not_run():
+    result = run('def main():\n    input()\n\n\nif __name__ == "__main__":\n    main()\n')
+    assert result["passed"] and result["error"] is None
+
+
+def test_reading_stdin_is_explained():
+    result = run("name = input()\n")
+    assert "EOFError" in result["error"] and "stdin" in result["error"]
+
+
+def test_docstring_examples_are_reported_apart_from_the_tests():
+    code = 'def add(a, b):\n    """\n    >>> add(1, 2)\n    4\n    """\n    return a + b\n'
+    result = run(code, ">>> add(2, 2)\n4\n")
+    assert result["passed"]
+    assert (result["attempted"], result["failed"]) == (1, 0)
+    assert (result["examples_attempted"], result["examples_failed"]) == (1, 1)
+    assert "add(1, 2)" in result["examples_failures"]
+
+
+def test_failing_tests_fail_the_run():
+    result = run("def add(a, b):\n    return a - b\n", ">>> add(2, 2)\n4\n")
+    assert not result["passed"] and result["failed"] == 1
+
+
+def test_processes_cannot_be_started():
+    result = run("import os\nos.fork()\n")
+    assert "BlockingIOError" in result["error"] or "PermissionError" in result["error"]
+
+
+def test_runs_are_killed_after_the_timeout():
+    result = run("while True:\n    pass\n", timeout=0.5)
+    assert result["error"] == "timed out after 0.5s"
+
+
+def test_the_code_does_not_see_the_environment(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "secret")
+    result = run("import os\nassert not os.environ, dict(os.environ)\n")
+    assert result["passed"], result["error"]
+
+
+def test_a_forged_report_does_not_pass_the_tests():
+    forged = '{"error": null, "attempted": 1, "failed": 0, "passed": true}'
+    code = f"import os\nfor fd in range(3, 64):\n    try:\n        os.write(fd, b'{forged}')\n    except OSError:\n        pass\n\n\ndef add(a, b):\n    return a - b\n"
+    result = run(code, ">>> add(2, 2)\n4\n")
+    assert not result["passed"]
+
+
+def test_expected_exceptions_pass():
+    result = run("def div(a, b):\n    return a / b\n", ">>> div(1, 0)\nTraceback (most recent call last):\nZeroDivisionError: division by zero\n>>> div(4, 2)\n2.0\n")
+    assert result["passed"] and (result["attempted"], result["failed"]) == (2, 0)
@@ -0,0 +1,106 @@
+import json
+import queue
+import select
+import subprocess
+import sys
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def serve(handler: Callable[..., Dict[str, Any]]) -> None:
+    """
+    The loop of a worker process: one JSON request per line on stdin, one JSON answer per
+    line on stdout.
+    """
+    for line in sys.stdin:
+        try:
+            answer = handler(**json.loads(line))
+        except Exception as error:
+            answer = {"worker_error": f"{type(error).__name__}: {error}"}
+        sys.stdout.write(json.dumps(answer) + "\n")
+        sys.stdout.flush()
+
+
+class Worker:
+    def __init__(self, command: List[str], preexec_fn: Optional[Callable[[], None]] = None, env: Optional[Dict[str, str]] = None):
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1, preexec_fn=preexec_fn, env=env
+        )
+
+    def call(self, request: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+            ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+            line = self.process.stdout.readline() if ready else None
+        except OSError as error:
+            raise WorkerError(f"worker failed: {error}")
+        if line is None:
+            raise WorkerError(f"timed out after {timeout}s")
+        if not line:
+            raise WorkerError(f"worker exited with code {self.process.wait()}")
+        answer = json.loads(line)
+        if "worker_error" in answer:
+            raise WorkerError(answer["worker_error"])
+        return answer
+
+    def stop(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+
+class WorkerPool:
+    """
+    Long-running Python processes that run `script`, started ahead of the first request so a
+    request does not pay for starting an interpreter. A worker that times out or dies is
+    replaced. The processes are started as plain scripts and not through multiprocessing,
+    which would run the Streamlit app again in every worker. `env` replaces the environment
+    the workers would inherit from the app.
+    """
+
+    def __init__(
+        self,
+        script: str,
+        workers: int,
+        timeout: float,
+        preexec_fn: Optional[Callable[[], None]] = None,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        self.command = [sys.executable, "-u", script]
+        self.workers = workers
+        self.timeout = timeout
+        self.preexec_fn = preexec_fn
+        self.env = env
+        self._idle: "queue.Queue[Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> None:
+        with self._lock:
+            if not self._started:
+                for _ in range(self.workers):
+                    self._idle.put(Worker(self.command, self.preexec_fn, self.env))
+                self._started = True
+
+    def call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The answer of the next idle worker, raises WorkerError if it did not answer in time.
+        """
+        self.start()
+        worker = self._idle.get()
+        try:
+            return worker.call(request, self.timeout)
+        except WorkerError:
+            worker.stop()
+            worker = Worker(self.command, self.preexec_fn, self.env)
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def stop(self) -> None:
+        while not self._idle.empty():
+            self._idle.get().stop()
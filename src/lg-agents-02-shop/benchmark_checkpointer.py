@@ -0,0 +1,81 @@
+import argparse
+import os
+import tempfile
+import time
+from typing import Annotated, List, TypedDict
+
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+
+from checkpointer import BoundedMemorySaver, SqliteCheckpointSaver, nbytes
+
+# roughly the size of a product search result returned to the agent
+TOOL_RESULT = "Product: Solid oak dining table. Measurements: Length: 140 cm Width: 80 cm. " * 40
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def build_graph():
+    # same shape as the shop: the agent calls a tool once per turn and then answers
+    def agent(state: State):
+        if isinstance(state["messages"][-1], ToolMessage):
+            return {"messages": [AIMessage("Here are some tables that fit.")]}
+        call_id = f"call_{len(state['messages'])}"
+        return {"messages": [AIMessage("", tool_calls=[{"name": "product_search_tool", "args": {"query": "table"}, "id": call_id}])]}
+
+    def tools(state: State):
+        return {"messages": [ToolMessage(TOOL_RESULT, tool_call_id=state["messages"][-1].tool_calls[0]["id"])]}
+
+    graph = StateGraph(State)
+    graph.add_node("agent", agent)
+    graph.add_node("tools", tools)
+    graph.add_edge(START, "agent")
+    graph.add_conditional_edges("agent", lambda state: "tools" if state["messages"][-1].tool_calls else END)
+    graph.add_edge("tools", "agent")
+    return graph
+
+
+def measure(label: str, saver, size, conversations: int, turns: int) -> None:
+    latencies: List[float] = []
+    put = saver.put
+
+    def timed_put(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return put(*args, **kwargs)
+        finally:
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    saver.put = timed_put
+    app = build_graph().compile(checkpointer=saver)
+    started = time.perf_counter()
+    for conversation in range(conversations):
+        config = {"configurable": {"thread_id": f"{label}-{conversation}"}}
+        for turn in range(turns):
+            app.invoke({"messages": [HumanMessage(f"I need a table for {turn + 2} people")]}, config)
+    seconds = time.perf_counter() - started
+
+    print(f"{label:<16} put p50 {np.percentile(latencies, 50):6.3f}ms  p95 {np.percentile(latencies, 95):6.3f}ms  "
+          f"total {seconds:6.2f}s  size per conversation {size() / conversations / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare checkpoint latency and size of the shop checkpointers")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--keep-last", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{args.conversations} conversations with {args.turns} turns each")
+    memory = BoundedMemorySaver()
+    measure("memory", memory, lambda: nbytes(memory.storage) + nbytes(memory.writes), args.conversations, args.turns)
+
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite = SqliteCheckpointSaver(os.path.join(directory, "checkpoints.db"), keep_last=args.keep_last)
+        measure("sqlite", sqlite, lambda: sqlite.stats()["payload_bytes"], args.conversations, args.turns)
+        print("sqlite:", sqlite.stats())
+        sqlite.close()
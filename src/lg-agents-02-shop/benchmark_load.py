@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.checkpoint.memory import MemorySaver
+
+from embedding_cache import CachedEmbeddings
+from hybrid_search import HybridIndex
+from intent_router import IntentRouter
+from numpy_store import NumpyVectorStore
+from search_cache import SemanticSearchCache
+from shop_graph import build_workflow
+from shop_search import ProductSearch
+
+DIMENSION = 256
+
+
+class FakeEmbeddings(Embeddings):
+    # deterministic random vectors after a fixed network latency
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        return np.random.default_rng(abs(hash(text)) % 2 ** 32).normal(size=DIMENSION).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Plays the shop conversation without a model deployment: the search agent calls the search
+    tool once and then answers, the orchestrator answers directly. Every call takes `latency` seconds.
+    """
+
+    latency: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-shop"
+
+    def bind_tools(self, tools: Any, **kwargs: Any):
+        return self.bind(tools=tools, **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[Any]) -> ChatResult:
+        last = messages[-1]
+        if tools and isinstance(last, HumanMessage):
+            message = AIMessage("", tool_calls=[{"name": "product_search_tool", "args": {"query": last.content}, "id": f"call_{id(last)}"}])
+        elif isinstance(last, ToolMessage):
+            message = AIMessage("Product-Search-Agent-Results: these tables fit your room.")
+        else:
+            message = AIMessage("Here is what the product search agent found for you.")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, tools: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._respond(messages, tools)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, tools: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages, tools)
+
+
+def build_app(directory: str, products: int, llm_latency: float, embedding_latency: float):
+    embeddings = CachedEmbeddings(FakeEmbeddings(embedding_latency), os.path.join(directory, "embeddings.db"), DIMENSION)
+    rng = np.random.default_rng(42)
+    store = NumpyVectorStore(embeddings, DIMENSION)
+    hybrid_index = HybridIndex()
+    ids = [f"product-{index}" for index in range(products)]
+    payloads = [{
+        "page_content": f"A solid wooden table number {index}",
+        "metadata": {"id": id, "title": f"Table {index}", "measurements": f"Width: {60 + index % 60} cm", "summary": "A solid wooden table."},
+    } for index, id in enumerate(ids)]
+    store.add_vectors(ids, rng.normal(size=(products, DIMENSION)), payloads)
+    for id in ids:
+        hybrid_index.add(store.get_by_ids([id])[0])
+    search = ProductSearch(embeddings, store, "load-test", SemanticSearchCache(), hybrid_index)
+    workflow = build_workflow(FakeChatModel(latency=llm_latency), search, IntentRouter(embeddings))
+    return workflow.compile(checkpointer=MemorySaver())
+
+
+def turn(index: int):
+    return {"messages": [HumanMessage(f"I need a table for {index} people")]}, {"configurable": {"thread_id": str(index)}}
+
+
+def run_threads(app, sessions: int) -> List[float]:
+    # before: one blocked thread per conversation
+    def run(index: int) -> float:
+        started = time.perf_counter()
+        app.invoke(*turn(index))
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        return list(executor.map(run, range(sessions)))
+
+
+def run_event_loop(app, sessions: int) -> List[float]:
+    # after: all conversations share one event loop
+    async def run(index: int) -> float:
+        started = time.perf_counter()
+        await app.ainvoke(*turn(index))
+        return time.perf_counter() - started
+
+    async def run_all() -> List[float]:
+        return list(await asyncio.gather(*(run(index) for index in range(sessions))))
+
+    return asyncio.run(run_all())
+
+
+def measure(label: str, run, app, sessions: int) -> None:
+    peak_threads = threading.active_count()
+    sampling = True
+
+    def sample() -> None:
+        nonlocal peak_threads
+        while sampling:
+            peak_threads = max(peak_threads, threading.active_count())
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started, cpu_started = time.perf_counter(), time.process_time()
+    latencies = run(app, sessions)
+    seconds, cpu_seconds = time.perf_counter() - started, time.process_time() - cpu_started
+    sampling = False
+    sampler.join()
+
+    # concurrent conversations one fully busy core can keep going: session duration / cpu time per session
+    per_core = np.mean(latencies) / (cpu_seconds / sessions)
+    print(f"{label:<12} {sessions} sessions in {seconds:6.2f}s  {sessions / seconds:7.1f} sessions/s  "
+          f"p95 {np.percentile(latencies, 95):6.2f}s  cpu {cpu_seconds / sessions * 1000:6.1f}ms/session  "
+          f"~{per_core:6.0f} sessions/core  peak threads {peak_threads}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the shop graph with a fake LLM, threads versus one event loop")
+    parser.add_argument("--sessions", type=int, default=200, help="concurrent conversations")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per LLM call")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="seconds per embedding call")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores, {args.llm_latency}s per LLM call, {args.embedding_latency}s per embedding call")
+    for label, run in (("threads", run_threads), ("event loop", run_event_loop)):
+        with tempfile.TemporaryDirectory() as directory:
+            app = build_app(directory, args.products, args.llm_latency, args.embedding_latency)
+            measure(label, run, app, args.sessions)
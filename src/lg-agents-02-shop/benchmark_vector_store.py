@@ -0,0 +1,96 @@
+import argparse
+import os
+import time
+import tracemalloc
+from typing import Callable, List, Set
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Batch, Distance, VectorParams
+
+from index_snapshot import DEFAULT_INDEX_PATH, IndexSnapshot, load_snapshot
+from numpy_store import QUANTIZATIONS, NumpyVectorStore
+
+K = 5
+
+
+def synthetic_catalog(count: int, dimension: int, seed: int = 42):
+    # clustered vectors behave more like real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 50), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.3 * rng.normal(size=(count, dimension)).astype(np.float32)
+    ids = ["00000000-0000-0000-0000-" + str(index).zfill(12) for index in range(count)]
+    payloads = [{"page_content": f"product {index}", "metadata": {"id": ids[index]}} for index in range(count)]
+    return ids, payloads, vectors
+
+
+def measure(label: str, build: Callable[[], Callable[[np.ndarray], List[str]]], queries: np.ndarray, truth: List[Set[str]]) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    search = build()
+    build_seconds = time.perf_counter() - started
+    resident, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    recall = 0.0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        found = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recall += len(expected & set(found)) / K
+
+    print(f"{label:<18} build {build_seconds:7.2f}s  p50 {np.percentile(latencies, 50):7.2f}ms  "
+          f"p95 {np.percentile(latencies, 95):7.2f}ms  recall@{K} {recall / len(queries):.3f}  "
+          f"memory {resident / 2 ** 20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the Qdrant in-memory path with the numpy vector store")
+    parser.add_argument("--snapshot", default=os.getenv("PRODUCT_INDEX_PATH", DEFAULT_INDEX_PATH),
+                        help="index snapshot to benchmark, synthetic vectors are used if it does not exist")
+    parser.add_argument("--count", type=int, default=100000, help="number of synthetic products")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    snapshot = load_snapshot(args.snapshot)
+    if snapshot is not None:
+        ids, payloads, vectors = snapshot.ids, snapshot.payloads, np.asarray(snapshot.vectors)
+        print(f"benchmarking snapshot {args.snapshot} with {len(ids)} products")
+    else:
+        ids, payloads, vectors = synthetic_catalog(args.count, args.dimension)
+        print(f"benchmarking {len(ids)} synthetic products with {args.dimension} dimensions")
+
+    # queries are perturbed catalog vectors, ground truth is exact float32 cosine search
+    rng = np.random.default_rng(7)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.1 * np.abs(queries).mean() * rng.normal(size=queries.shape).astype(np.float32)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    truth = []
+    for query in queries:
+        scores = normalized @ (query / np.linalg.norm(query))
+        truth.append({ids[row] for row in np.argpartition(-scores, K)[:K]})
+
+    def build_qdrant():
+        client = QdrantClient(":memory:")
+        client.create_collection(
+            collection_name="products",
+            vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE),
+        )
+        for start in range(0, len(ids), 1000):
+            end = start + 1000
+            client.upsert(collection_name="products", points=Batch(
+                ids=ids[start:end], vectors=vectors[start:end].tolist(), payloads=payloads[start:end]))
+        return lambda query: [str(point.id) for point in
+                              client.query_points(collection_name="products", query=query.tolist(), limit=K).points]
+
+    measure("qdrant :memory:", build_qdrant, queries, truth)
+
+    for quantization in QUANTIZATIONS:
+        def build_numpy():
+            catalog = IndexSnapshot(manifest={"dimension": vectors.shape[1]}, ids=ids, payloads=payloads, vectors=vectors)
+            store = NumpyVectorStore.from_snapshot(catalog, None, quantization)
+            return lambda query: [doc.metadata["id"] for doc in store.similarity_search_by_vector(query, K)]
+
+        measure(f"numpy {quantization}", build_numpy, queries, truth)
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import re
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+
+def product_id(obj: Dict[str, Any]) -> str:
+    return "00000000-0000-0000-0000-" + str(obj.get('id')).zfill(12)
+
+
+def summarize(description: Optional[str], max_chars: int = 200) -> str:
+    """
+    Short extractive summary of a product description: its leading sentences up to max_chars.
+    """
+    paragraph = (description or "").strip().split("\n\n")[0]
+    summary = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+        if summary and len(summary) + len(sentence) + 1 > max_chars:
+            break
+        summary = (summary + " " + sentence).strip()
+    if len(summary) > max_chars:
+        summary = summary[:max_chars - 3].rsplit(" ", 1)[0] + "..."
+    return summary
+
+
+def product_to_document(obj: Dict[str, Any]) -> Document:
+    return Document(
+        page_content=obj.get('description'),
+        metadata={
+            "url": obj.get('url'),
+            "title": obj.get('title'),
+            "id": product_id(obj),
+            "measurements": obj.get('measurements'),
+            "product-image-url": obj.get('product-image-url'),
+            "summary": summarize(obj.get('description')),
+        },
+    )
+
+
+def product_fingerprint(doc: Document) -> str:
+    content = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def document_payload(doc: Document) -> Dict[str, Any]:
+    # same payload layout QdrantVectorStore writes and reads, plus a fingerprint for incremental syncs
+    return {"page_content": doc.page_content, "metadata": doc.metadata, "fingerprint": product_fingerprint(doc)}
+
+
+def iter_products(path: str = 'products.json', chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the products of a JSON array file one by one without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open(file=path, mode='r', encoding='utf-8') as file:
+        buffer = ""
+        started = False
+        eof = False
+        while True:
+            buffer = buffer.lstrip()
+            if started and buffer.startswith(','):
+                buffer = buffer[1:].lstrip()
+            if started and buffer.startswith(']'):
+                return
+            if not started and buffer.startswith('['):
+                buffer = buffer[1:]
+                started = True
+                continue
+            try:
+                if not started or not buffer:
+                    raise json.JSONDecodeError("need more data", buffer, 0)
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError(f"{path} is not a JSON array of products")
+                chunk = file.read(chunk_size)
+                eof = chunk == ""
+                buffer += chunk
+                continue
+            buffer = buffer[end:]
+            yield obj
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def catalog_version(path: str = 'products.json') -> str:
+    digest = hashlib.sha256()
+    with open(file=path, mode='rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
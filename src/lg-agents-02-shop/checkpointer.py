@@ -0,0 +1,520 @@
+import asyncio
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.constants import TASKS
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(".cache", "checkpoints.db")
+
+
+def nbytes(value: Any) -> int:
+    # size of the serialized payloads held in the saver's nested tuples and dicts
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(nbytes(item) for item in value.values())
+    return 0
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-memory checkpointer that bounds the number of conversation threads it keeps.
+
+    Threads are evicted least recently used first when there are more than `max_threads`,
+    when they have been idle for longer than `ttl` seconds or when all checkpoints together
+    take more than `max_bytes`. LangGraph does not tell a saver when a run ends, so threads
+    written within the last `active` seconds count as running and are not evicted. While many
+    sessions run at once, the saver can go over its bounds.
+    """
+
+    def __init__(
+        self,
+        max_threads: Optional[int] = None,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        active: Optional[float] = None,
+    ):
+        super().__init__()
+        self.max_threads = int(os.getenv("CHECKPOINT_MAX_THREADS", "100")) if max_threads is None else max_threads
+        self.ttl = float(os.getenv("CHECKPOINT_TTL", "3600")) if ttl is None else ttl
+        self.max_bytes = int(os.getenv("CHECKPOINT_MAX_BYTES", str(256 * 1024 * 1024))) if max_bytes is None else max_bytes
+        # longer than a turn takes, a thread evicted between two steps of a run loses its conversation
+        self.active = float(os.getenv("CHECKPOINT_ACTIVE_SECONDS", "120")) if active is None else active
+        self.evictions = 0
+        # thread id -> (last used, checkpoint bytes), least recently used first
+        self._threads: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        # thread id -> last write, reads move a thread up but don't make it running
+        self._written: Dict[str, float] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def _touch(self, thread_id: str, added_bytes: int = 0) -> None:
+        _, size = self._threads.pop(thread_id, (0.0, 0))
+        self._threads[thread_id] = (time.time(), size + added_bytes)
+        self._bytes += added_bytes
+
+    def _write(self, thread_id: str, added_bytes: int) -> None:
+        self._touch(thread_id, added_bytes)
+        self._written[thread_id] = time.time()
+        self._evict(keep=thread_id)
+
+    def _drop(self, thread_id: str) -> None:
+        _, size = self._threads.pop(thread_id, (0.0, 0))
+        self._written.pop(thread_id, None)
+        self._bytes -= size
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            del self.writes[key]
+        blobs = getattr(self, "blobs", None)
+        if blobs:
+            for key in [key for key in blobs if key[0] == thread_id]:
+                del blobs[key]
+        self.evictions += 1
+
+    def _evict(self, keep: str) -> None:
+        now = time.time()
+        running = {thread_id for thread_id, written in self._written.items() if now - written < self.active}
+        running.add(keep)
+        for thread_id, (last_used, _) in list(self._threads.items()):
+            if thread_id not in running and now - last_used > self.ttl:
+                self._drop(thread_id)
+        for thread_id in list(self._threads):
+            if len(self._threads) <= self.max_threads and self._bytes <= self.max_bytes:
+                break
+            if thread_id not in running:
+                self._drop(thread_id)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            # MemorySaver reads from defaultdicts, looking up a new thread would store an empty one
+            if thread_id not in self.storage:
+                return None
+            if thread_id in self._threads:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config and config["configurable"]["thread_id"] not in self.storage:
+            return iter(())
+        return super().list(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        with self._lock:
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = saved["configurable"]["thread_id"]
+            checkpoint_ns = saved["configurable"].get("checkpoint_ns", "")
+            added = nbytes(self.storage[thread_id][checkpoint_ns][saved["configurable"]["checkpoint_id"]])
+            blobs = getattr(self, "blobs", None)
+            if blobs:
+                added += sum(nbytes(blobs.get((thread_id, checkpoint_ns, channel, version)))
+                             for channel, version in new_versions.items())
+            self._write(thread_id, added)
+            return saved
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            key = (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+            before = nbytes(self.writes.get(key))
+            super().put_writes(config, writes, task_id)
+            self._write(thread_id, nbytes(self.writes.get(key)) - before)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "live_threads": len(self._threads),
+                "checkpoint_bytes": self._bytes,
+                "evictions": self.evictions,
+            }
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """
+    Durable checkpointer backed by a local SQLite file.
+
+    Checkpoints are serialized on the calling thread and written by a background thread, so graph
+    steps do not wait for the disk. Messages are stored once per thread and checkpoints only
+    reference them, so every checkpoint only adds the messages of its own step instead of a copy
+    of the whole conversation. Only the latest `keep_last` checkpoints of a thread are kept.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        keep_last: Optional[int] = None,
+        serde: Optional[SerializerProtocol] = None,
+    ):
+        super().__init__(serde=serde)
+        self.path = path or os.getenv("CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH)
+        self.keep_last = int(os.getenv("CHECKPOINT_KEEP_LAST", "10")) if keep_last is None else keep_last
+        if self.keep_last < 1:
+            # the latest checkpoint is the conversation, it can't be pruned
+            raise ValueError(f"keep_last must be at least 1, got {self.keep_last}")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT,
+                checkpoint BLOB,
+                metadata_type TEXT,
+                metadata BLOB,
+                message_refs TEXT,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                thread_id TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                revision INTEGER NOT NULL,
+                type TEXT,
+                message BLOB,
+                PRIMARY KEY (thread_id, message_id, revision)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT,
+                value BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+        """)
+        self._connection.commit()
+        self._lock = threading.Lock()
+        # message id -> (message object, revision) of recently used threads, guarded by _known_lock
+        # as graphs of several sessions put checkpoints at the same time
+        self._known: "OrderedDict[str, Dict[str, Tuple[Any, int]]]" = OrderedDict()
+        self._puts: Dict[str, int] = {}
+        self._known_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Callable[[sqlite3.Connection], None]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _write_loop(self) -> None:
+        while True:
+            operation = self._queue.get()
+            if operation is None:
+                self._queue.task_done()
+                return
+            operations = [operation]
+            # commit everything that queued up in one transaction
+            while True:
+                try:
+                    operations.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._lock:
+                for operation in operations:
+                    if operation is not None:
+                        operation(self._connection)
+                self._connection.commit()
+            for _ in operations:
+                self._queue.task_done()
+            if operations[-1] is None:
+                return
+
+    def flush(self) -> None:
+        """Blocks until all queued checkpoint writes are on disk."""
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def _known_messages(self, thread_id: str) -> Dict[str, Tuple[Any, int]]:
+        # callers hold _known_lock while they use the result, the writer thread never takes it
+        known = self._known.get(thread_id)
+        if known is None:
+            self.flush()
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT message_id, MAX(revision) FROM messages WHERE thread_id = ? GROUP BY message_id",
+                    (thread_id,),
+                ).fetchall()
+            # unknown objects always count as changed and get the next revision
+            known = {message_id: (None, revision) for message_id, revision in rows}
+            self._known[thread_id] = known
+        self._known.move_to_end(thread_id)
+        while len(self._known) > 256:
+            self._known.popitem(last=False)
+        return known
+
+    def _load_messages(self, thread_id: str, refs: List[List[Any]]) -> List[Any]:
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT message_id, revision, type, message FROM messages WHERE thread_id = ? "
+                f"AND message_id IN ({','.join('?' * len(refs))})",
+                (thread_id, *[message_id for message_id, _ in refs]),
+            ).fetchall()
+        stored = {(message_id, revision): (type, blob) for message_id, revision, type, blob in rows}
+        messages = [self.serde.loads_typed(stored[(message_id, revision)]) for message_id, revision in refs]
+        with self._known_lock:
+            known = self._known_messages(thread_id)
+            for (message_id, revision), message in zip(refs, messages):
+                known[message_id] = (message, revision)
+        return messages
+
+    def _to_tuple(self, row: Tuple[Any, ...]) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, blob, metadata_type, metadata, refs = row
+        checkpoint = self.serde.loads_typed((type, blob))
+        if refs is not None:
+            refs = json.loads(refs)
+            checkpoint["channel_values"]["messages"] = self._load_messages(thread_id, refs) if refs else []
+        with self._lock:
+            writes = self._connection.execute(
+                "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? "
+                "AND checkpoint_id = ? ORDER BY task_id, idx",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchall()
+            sends = self._connection.execute(
+                "SELECT type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+                "AND channel = ? ORDER BY task_id, idx",
+                (thread_id, checkpoint_ns, parent_checkpoint_id, TASKS),
+            ).fetchall() if parent_checkpoint_id else []
+        checkpoint["pending_sends"] = [self.serde.loads_typed(send) for send in sends]
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=checkpoint,
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config={
+                "configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}
+            } if parent_checkpoint_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((type, value))) for task_id, channel, type, value in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self.flush()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        if checkpoint_id := get_checkpoint_id(config):
+            params = (thread_id, checkpoint_ns, checkpoint_id)
+            query += " AND checkpoint_id = ?"
+        else:
+            params = (thread_id, checkpoint_ns)
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self._connection.execute(query, params).fetchone()
+        return self._to_tuple(row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        self.flush()
+        conditions = []
+        params: List[Any] = []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_checkpoint_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_checkpoint_id)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT * FROM checkpoints{where} ORDER BY checkpoint_id DESC", params
+            ).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads_typed((row[6], row[7]))
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            yield self._to_tuple(row)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = checkpoint.copy()
+        saved.pop("pending_sends", None)
+        values = dict(saved["channel_values"])
+        messages = values.get("messages")
+
+        refs = None
+        message_rows = []
+        if isinstance(messages, list) and all(getattr(message, "id", None) for message in messages):
+            del values["messages"]
+            refs = []
+            with self._known_lock:
+                known = self._known_messages(thread_id)
+                for message in messages:
+                    entry = known.get(message.id)
+                    # messages that are the very same object as in an earlier checkpoint are not stored again
+                    if entry is None or entry[0] is not message:
+                        revision = 0 if entry is None else entry[1] + 1
+                        known[message.id] = (message, revision)
+                        message_rows.append((thread_id, message.id, revision, *self.serde.dumps_typed(message)))
+                    refs.append([message.id, known[message.id][1]])
+        saved["channel_values"] = values
+
+        checkpoint_row = (
+            thread_id,
+            checkpoint_ns,
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            *self.serde.dumps_typed(saved),
+            *self.serde.dumps_typed(metadata),
+            json.dumps(refs) if refs is not None else None,
+        )
+
+        def write(connection: sqlite3.Connection) -> None:
+            connection.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)", message_rows)
+            connection.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", checkpoint_row)
+
+        with self._known_lock:
+            self._queue.put(write)
+            self._puts[thread_id] = self._puts.get(thread_id, 0) + 1
+            compact = self._puts[thread_id] % self.keep_last == 0
+        if compact:
+            self._queue.put(lambda connection: self._compact(connection, thread_id))
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = [
+            (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, *self.serde.dumps_typed(value))
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        # special writes replace earlier ones, regular writes are only stored once
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        statement = f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        self._queue.put(lambda connection: connection.executemany(statement, rows))
+
+    def _compact(self, connection: sqlite3.Connection, thread_id: str) -> None:
+        connection.execute("""
+            DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id NOT IN (
+                SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT ?
+            )""", (thread_id, thread_id, self.keep_last))
+        connection.execute("""
+            DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN (
+                SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?
+            )""", (thread_id, thread_id))
+        referenced = set()
+        for (refs,) in connection.execute(
+            "SELECT message_refs FROM checkpoints WHERE thread_id = ? AND message_refs IS NOT NULL", (thread_id,)
+        ):
+            referenced.update((message_id, revision) for message_id, revision in json.loads(refs))
+        stored = connection.execute("SELECT message_id, revision FROM messages WHERE thread_id = ?", (thread_id,)).fetchall()
+        connection.executemany(
+            "DELETE FROM messages WHERE thread_id = ? AND message_id = ? AND revision = ?",
+            [(thread_id, message_id, revision) for message_id, revision in stored if (message_id, revision) not in referenced],
+        )
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        # put serializes on the calling thread and may wait for the writer to load a thread's messages,
+        # neither belongs on the event loop
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id)
+
+    def stats(self) -> Dict[str, int]:
+        self.flush()
+        with self._lock:
+            checkpoints, threads = self._connection.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT thread_id) FROM checkpoints"
+            ).fetchone()
+            messages, message_bytes = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(message)), 0) FROM messages"
+            ).fetchone()
+            (checkpoint_bytes,) = self._connection.execute(
+                "SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata) + COALESCE(LENGTH(message_refs), 0)), 0) FROM checkpoints"
+            ).fetchone()
+            (write_bytes,) = self._connection.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()
+        return {
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "messages": messages,
+            "payload_bytes": message_bytes + checkpoint_bytes + write_bytes,
+            "file_bytes": sum(os.path.getsize(path) for path in (self.path, self.path + "-wal") if os.path.exists(path)),
+        }
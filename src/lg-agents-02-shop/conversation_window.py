@@ -0,0 +1,111 @@
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+# matches the ids and titles in the repr of the ProductSummary / ProductSearchResult tool results
+PRODUCT_PATTERN = re.compile(r"id='([^']+)', title=(['\"])(.*?)\2")
+
+# tool results shorter than this are kept as they are, e.g. the questions answered by ask_human
+COLLAPSE_MIN_CHARS = 200
+
+
+def product_references(content: str) -> str:
+    products = [f"{title} ({id})" for id, _, title in PRODUCT_PATTERN.findall(content)]
+    if not products:
+        return "no products"
+    return "products " + "; ".join(dict.fromkeys(products))
+
+
+def collapse(message: BaseMessage) -> BaseMessage:
+    """
+    Replaces a long tool result with a one-line reference to the products it contained.
+    """
+    if not isinstance(message, ToolMessage) or len(str(message.content)) < COLLAPSE_MIN_CHARS:
+        return message
+    content = f"[earlier result of {message.name or 'a tool'} with {product_references(str(message.content))}, use product_details_tool for details]"
+    return ToolMessage(content, tool_call_id=message.tool_call_id, name=message.name, id=message.id)
+
+
+def transcript(messages: List[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        message = collapse(message)
+        if isinstance(message, AIMessage) and message.tool_calls:
+            calls = ", ".join(f"{call['name']}({call['args']})" for call in message.tool_calls)
+            lines.append(f"{message.type}: {message.content} [called {calls}]")
+        elif message.content:
+            lines.append(f"{message.type}: {message.content}")
+    return "\n".join(lines)
+
+
+class ConversationWindow:
+    """
+    Shrinks the message history that is sent to the LLM.
+
+    The latest `turns` user turns are sent verbatim. Tool results of older turns are collapsed into
+    short references, and once `summary_batch` such turns have piled up they are folded into a
+    rolling summary. Folding only sends the previous summary and the newly dropped messages to
+    `summarize`, never the whole conversation.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[str, List[BaseMessage]], str],
+        count_tokens: Callable[[List[BaseMessage]], int],
+        turns: Optional[int] = None,
+        summary_batch: Optional[int] = None,
+        asummarize: Optional[Callable[[str, List[BaseMessage]], Awaitable[str]]] = None,
+    ):
+        self.summarize = summarize
+        self.asummarize = asummarize
+        self.count_tokens = count_tokens
+        self.turns = int(os.getenv("CONVERSATION_WINDOW_TURNS", "3")) if turns is None else turns
+        self.summary_batch = int(os.getenv("CONVERSATION_SUMMARY_BATCH", "3")) if summary_batch is None else summary_batch
+        # the window always holds the current turn, and folding nothing would summarize on every call
+        if self.turns < 1 or self.summary_batch < 1:
+            raise ValueError(f"turns and summary_batch must be at least 1, got {self.turns} and {self.summary_batch}")
+
+    def _window(self, state: Dict[str, Any]) -> Tuple[int, bool]:
+        # windows only start at user messages, so tool calls are never split from their results
+        messages = state["messages"]
+        summarized = state.get("summarized") or 0
+        starts = [index for index, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        window_start = starts[-self.turns] if len(starts) >= self.turns else 0
+        fold = len([start for start in starts if summarized <= start < window_start]) >= self.summary_batch
+        return window_start, fold
+
+    def _prompt(self, messages: List[BaseMessage], summary: str, summarized: int, window_start: int, node: str) -> List[BaseMessage]:
+        prompt = [SystemMessage(f"Summary of the earlier conversation: {summary}")] if summary else []
+        prompt += [collapse(message) for message in messages[summarized:window_start]]
+        prompt += messages[window_start:]
+        print(f"prompt tokens {node}: {self.count_tokens(prompt)} of {self.count_tokens(messages)} for the full history")
+        return prompt
+
+    def prepare(self, state: Dict[str, Any], node: str) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        """
+        Returns the messages to send for `state` and the state updates for the rolling summary.
+        """
+        messages = state["messages"]
+        summary = state.get("summary") or ""
+        summarized = state.get("summarized") or 0
+        window_start, fold = self._window(state)
+        updates: Dict[str, Any] = {}
+        if fold:
+            summary = self.summarize(summary, messages[summarized:window_start])
+            summarized = window_start
+            updates = {"summary": summary, "summarized": summarized}
+        return self._prompt(messages, summary, summarized, window_start, node), updates
+
+    async def aprepare(self, state: Dict[str, Any], node: str) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        messages = state["messages"]
+        summary = state.get("summary") or ""
+        summarized = state.get("summarized") or 0
+        window_start, fold = self._window(state)
+        updates: Dict[str, Any] = {}
+        if fold:
+            summary = await self.asummarize(summary, messages[summarized:window_start])
+            summarized = window_start
+            updates = {"summary": summary, "summarized": summarized}
+        return self._prompt(messages, summary, summarized, window_start, node), updates
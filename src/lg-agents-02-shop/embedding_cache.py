@@ -0,0 +1,219 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "embeddings.db")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model with a persistent on-disk cache for document vectors.
+
+    Vectors are stored in a local SQLite file keyed by embedding model, deployment,
+    dimension and a hash of the embedded text, so only new or changed texts are sent
+    to the embedding API.
+
+    Query vectors go through a bounded LRU cache with a time to live. With
+    `persist_queries` they are also written to the SQLite file, so other processes
+    on the same host can reuse them.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: Optional[str] = None,
+        dimension: int = 1536,
+        query_cache_size: Optional[int] = None,
+        query_cache_ttl: Optional[float] = None,
+        persist_queries: Optional[bool] = None,
+    ):
+        self.embeddings = embeddings
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.model = getattr(embeddings, "model", None) or ""
+        self.deployment = getattr(embeddings, "deployment", None) or ""
+        self.dimension = getattr(embeddings, "dimensions", None) or dimension
+        self.hits = 0
+        self.misses = 0
+        # 0 turns the in-memory query cache off
+        self.query_cache_size = int(os.getenv("QUERY_CACHE_SIZE", "1024")) if query_cache_size is None else query_cache_size
+        self.query_cache_ttl = float(os.getenv("QUERY_CACHE_TTL", "3600")) if query_cache_ttl is None else query_cache_ttl
+        if persist_queries is None:
+            persist_queries = os.getenv("QUERY_CACHE_PERSIST", "false").lower() == "true"
+        self.persist_queries = persist_queries
+        self.query_hits = 0
+        self.query_misses = 0
+        self.query_evictions = 0
+        self._queries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS document_embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def cache_key(self, text: str) -> str:
+        prefix = f"{self.model}|{self.deployment}|{self.dimension}|"
+        return content_hash(prefix + content_hash(text))
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        # stay below the default SQLite host parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._connection.execute(
+                f"SELECT key, vector FROM document_embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[key] = vector.tolist()
+        return found
+
+    def _store(self, items: Dict[str, List[float]]) -> None:
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO document_embeddings (key, vector) VALUES (?, ?)",
+            [(key, array("f", vector).tobytes()) for key, vector in items.items()],
+        )
+        self._connection.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache_key(text) for text in texts]
+        with self._lock:
+            found = self._lookup(list(set(keys)))
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            with self._lock:
+                self._store(computed)
+            found.update(computed)
+
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        return [found[key] for key in keys]
+
+    def _cached_query(self, key: str) -> Optional[List[float]]:
+        now = time.time()
+        entry = self._queries.get(key)
+        if entry is not None:
+            created, vector = entry
+            if now - created <= self.query_cache_ttl:
+                self._queries.move_to_end(key)
+                return vector
+            del self._queries[key]
+            self.query_evictions += 1
+
+        if self.persist_queries:
+            row = self._connection.execute(
+                "SELECT vector, created FROM query_embeddings WHERE key = ? AND created >= ?",
+                (key, now - self.query_cache_ttl),
+            ).fetchone()
+            if row is not None:
+                vector = array("f")
+                vector.frombytes(row[0])
+                # with a size of 0 the vector is not kept in memory
+                self._remember_query(key, row[1], vector.tolist())
+                return vector.tolist()
+        return None
+
+    def _remember_query(self, key: str, created: float, vector: List[float]) -> None:
+        self._queries[key] = (created, vector)
+        self._queries.move_to_end(key)
+        while len(self._queries) > self.query_cache_size:
+            self._queries.popitem(last=False)
+            self.query_evictions += 1
+
+    def _lookup_queries(self, keys: List[str], texts: List[str]) -> Tuple[Dict[str, List[float]], Dict[str, str]]:
+        found: Dict[str, List[float]] = {}
+        missing: Dict[str, str] = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                vector = self._cached_query(key)
+                if vector is not None:
+                    self.query_hits += 1
+                    found[key] = vector
+                else:
+                    self.query_misses += 1
+                    missing[key] = text
+        return found, missing
+
+    def _store_queries(self, missing: Dict[str, str], vectors: List[List[float]], found: Dict[str, List[float]]) -> None:
+        created = time.time()
+        with self._lock:
+            for key, vector in zip(missing.keys(), vectors):
+                self._remember_query(key, created, vector)
+                found[key] = vector
+            if self.persist_queries:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO query_embeddings (key, vector, created) VALUES (?, ?, ?)",
+                    [(key, array("f", vector).tobytes(), created) for key, vector in zip(missing.keys(), vectors)],
+                )
+                self._connection.commit()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries, sending all cache misses to the embedding API in a single call.
+        """
+        keys = [self.cache_key(" ".join(text.split())) for text in texts]
+        found, missing = self._lookup_queries(keys, texts)
+        if missing:
+            if len(missing) == 1:
+                vectors = [self.embeddings.embed_query(next(iter(missing.values())))]
+            else:
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+            self._store_queries(missing, vectors, found)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        # same as embed_queries, but cache misses are awaited instead of blocking the event loop
+        keys = [self.cache_key(" ".join(text.split())) for text in texts]
+        found, missing = self._lookup_queries(keys, texts)
+        if missing:
+            if len(missing) == 1:
+                vectors = [await self.embeddings.aembed_query(next(iter(missing.values())))]
+            else:
+                vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            self._store_queries(missing, vectors, found)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_queries([text]))[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "query_hits": self.query_hits,
+            "query_misses": self.query_misses,
+            "query_evictions": self.query_evictions,
+            "cached_queries": len(self._queries),
+        }
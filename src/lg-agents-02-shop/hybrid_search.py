@@ -0,0 +1,182 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from catalog import product_to_document
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)?")
+MEASUREMENT_PATTERN = re.compile(r"([A-Za-z][A-Za-z ]*?):\s*([0-9]+(?:[.,][0-9]+)?)\s*(mm|cm|m|kg)?\b")
+FILTER_PATTERN = re.compile(r"([A-Za-z][A-Za-z _]*?)\s*(<=|>=|<|>|=)\s*([0-9]+(?:[.,][0-9]+)?)\s*(mm|cm|m)?")
+
+# a title match says more about a product than a match in its description
+FIELD_WEIGHTS = {"title": 3, "measurements": 1, "description": 1}
+TO_CM = {"mm": 0.1, "cm": 1.0, "m": 100.0}
+
+# (minimum, maximum) per measurement, either side may be open
+Filters = Dict[str, Tuple[Optional[float], Optional[float]]]
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def measurement_key(name: str) -> str:
+    return "_".join(name.lower().replace("_", " ").split())
+
+
+def parse_measurements(text: Optional[str]) -> Dict[str, float]:
+    """
+    Parses strings like 'Length:  140 cm Width:  80 cm' into {'length': 140.0, 'width': 80.0}.
+    Lengths are converted to centimeters.
+    """
+    measurements = {}
+    for name, value, unit in MEASUREMENT_PATTERN.findall(text or ""):
+        measurements[measurement_key(name)] = float(value.replace(",", ".")) * TO_CM.get(unit, 1.0)
+    return measurements
+
+
+def parse_filters(text: Optional[str]) -> Filters:
+    """
+    Parses filters like 'width <= 90, length >= 2 m' into {'width': (None, 90.0), 'length': (200.0, None)}.
+    """
+    filters: Filters = {}
+    for name, operator, value, unit in FILTER_PATTERN.findall(text or ""):
+        key = measurement_key(name)
+        number = float(value.replace(",", ".")) * TO_CM.get(unit, 1.0)
+        low, high = filters.get(key, (None, None))
+        if operator in ("<", "<=", "="):
+            high = number if high is None else min(high, number)
+        if operator in (">", ">=", "="):
+            low = number if low is None else max(low, number)
+        filters[key] = (low, high)
+    return filters
+
+
+def matches(measurements: Dict[str, float], filters: Filters) -> bool:
+    """Whether the parsed measurements of a product pass all filters, a missing measurement fails."""
+    for key, (low, high) in filters.items():
+        value = measurements.get(key)
+        if value is None or (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return True
+
+
+class HybridIndex:
+    """
+    BM25 inverted index over product title, description and measurements, plus a table of
+    parsed measurements used to restrict both the lexical and the vector side before scoring.
+    Lexical and vector rankings are merged with reciprocal rank fusion.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, rrf_k: int = 60):
+        self.k1 = k1
+        self.b = b
+        self.rrf_k = rrf_k
+        self.documents: List[Document] = []
+        self.rows: Dict[str, int] = {}
+        self.measurements: List[Dict[str, float]] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths: List[int] = []
+        self.total_length = 0
+
+    def add(self, doc: Document) -> None:
+        row = len(self.documents)
+        tokens = []
+        for field, weight in FIELD_WEIGHTS.items():
+            text = doc.page_content if field == "description" else doc.metadata.get(field)
+            tokens.extend(tokenize(text) * weight)
+        for term, frequency in Counter(tokens).items():
+            self.postings[term].append((row, frequency))
+        self.lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        self.documents.append(doc)
+        self.rows[doc.metadata["id"]] = row
+        self.measurements.append(parse_measurements(doc.metadata.get("measurements")))
+
+    @classmethod
+    def from_products(cls, products: Iterable[dict]) -> "HybridIndex":
+        index = cls()
+        for obj in products:
+            index.add(product_to_document(obj))
+        return index
+
+    def allowed_rows(self, filters: Filters) -> Optional[Set[int]]:
+        if not filters:
+            return None
+        return {row for row, measurements in enumerate(self.measurements) if matches(measurements, filters)}
+
+    def lexical_search(self, query: str, k: int, allowed: Optional[Set[int]] = None) -> List[int]:
+        if not self.documents:
+            return []
+        average_length = self.total_length / len(self.lengths)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, frequency in postings:
+                if allowed is not None and row not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[row] / average_length)
+                scores[row] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores, key=scores.get, reverse=True)[:k]
+
+    def fuse(self, lexical: List[Document], semantic: List[Document], k: int) -> List[Tuple[Document, float]]:
+        scores: Dict[str, float] = defaultdict(float)
+        documents: Dict[str, Document] = {}
+        for ranking in (lexical, semantic):
+            for rank, doc in enumerate(ranking):
+                id = doc.metadata["id"]
+                scores[id] += 1 / (self.rrf_k + rank + 1)
+                documents.setdefault(id, doc)
+        return [(documents[id], scores[id]) for id in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+    def _lexical_side(
+        self, query: str, filters: Optional[Filters], candidates: int
+    ) -> Optional[Tuple[List[Document], Optional[Set[str]]]]:
+        allowed = self.allowed_rows(filters or {})
+        if allowed is not None and not allowed:
+            return None
+        lexical = [self.documents[row] for row in self.lexical_search(query, candidates, allowed)]
+        allowed_ids = None if allowed is None else {self.documents[row].metadata["id"] for row in allowed}
+        return lexical, allowed_ids
+
+    def search(
+        self,
+        query: str,
+        vector_search: Callable[[Optional[Set[str]], int], List[Tuple[Document, float]]],
+        k: int = 5,
+        filters: Optional[Filters] = None,
+        candidates: int = 20,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Runs the lexical search and `vector_search(allowed_ids, candidates)` over the products
+        that pass the measurement filters and fuses both rankings into the top k, scored by
+        their reciprocal rank fusion score.
+        """
+        lexical_side = self._lexical_side(query, filters, candidates)
+        if lexical_side is None:
+            return []
+        lexical, allowed_ids = lexical_side
+        semantic = [doc for doc, _ in vector_search(allowed_ids, candidates)]
+        return self.fuse(lexical, semantic, k)
+
+    async def asearch(
+        self,
+        query: str,
+        avector_search: Callable[[Optional[Set[str]], int], Awaitable[List[Tuple[Document, float]]]],
+        k: int = 5,
+        filters: Optional[Filters] = None,
+        candidates: int = 20,
+    ) -> List[Tuple[Document, float]]:
+        # the lexical side is in memory, only the vector search is awaited
+        lexical_side = self._lexical_side(query, filters, candidates)
+        if lexical_side is None:
+            return []
+        lexical, allowed_ids = lexical_side
+        semantic = [doc for doc, _ in await avector_search(allowed_ids, candidates)]
+        return self.fuse(lexical, semantic, k)
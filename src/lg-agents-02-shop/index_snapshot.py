@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import dotenv
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from catalog import catalog_version, document_payload, iter_batches, iter_products, product_to_document
+
+# bump when the on-disk layout changes
+FORMAT_VERSION = 1
+DEFAULT_INDEX_PATH = "product-index"
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+PAYLOADS_FILE = "payloads.jsonl"
+
+
+@dataclass
+class IndexSnapshot:
+    manifest: Dict[str, Any]
+    ids: List[str]
+    payloads: List[Dict[str, Any]]
+    vectors: np.memmap
+
+    @property
+    def catalog_version(self) -> str:
+        return self.manifest["catalog_version"]
+
+
+def build_snapshot(products_path: str, embeddings: Embeddings, out_path: str, batch_size: int = 256) -> Dict[str, Any]:
+    """
+    Embeds the product catalog and writes it as a read-only index snapshot.
+
+    The snapshot is a directory with a JSON manifest, a row-major little-endian float32
+    vector matrix that can be memory-mapped, and one JSON payload per line in the same order.
+    """
+    tmp_path = out_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    dimension = None
+    count = 0
+    with open(os.path.join(tmp_path, VECTORS_FILE), "wb") as vectors_file, \
+            open(os.path.join(tmp_path, PAYLOADS_FILE), "w") as payloads_file:
+        for products in iter_batches(iter_products(products_path), batch_size):
+            docs = [product_to_document(obj) for obj in products]
+            vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]), dtype="<f4")
+            dimension = dimension or vectors.shape[1]
+            vectors_file.write(vectors.tobytes())
+            for doc in docs:
+                payloads_file.write(json.dumps({"id": doc.metadata["id"], **document_payload(doc)}) + "\n")
+            count += len(docs)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "catalog_version": catalog_version(products_path),
+        "model": getattr(embeddings, "model", None),
+        "deployment": getattr(embeddings, "deployment", None),
+        "dimension": dimension or 0,
+        "count": count,
+        "dtype": "float32",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    shutil.rmtree(out_path, ignore_errors=True)
+    os.replace(tmp_path, out_path)
+    return manifest
+
+
+def load_snapshot(path: str) -> Optional[IndexSnapshot]:
+    """
+    Opens an index snapshot without copying its vectors into memory.
+    Returns None if there is no compatible snapshot at the given path.
+    """
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        print("ignoring index snapshot with unsupported format version: ", manifest.get("format_version"))
+        return None
+    if manifest["count"] == 0:
+        return None
+
+    ids = []
+    payloads = []
+    with open(os.path.join(path, PAYLOADS_FILE), "r") as payloads_file:
+        for line in payloads_file:
+            payload = json.loads(line)
+            ids.append(payload.pop("id"))
+            payloads.append(payload)
+
+    shape = (manifest["count"], manifest["dimension"])
+    vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype="<f4", mode="r", shape=shape)
+    return IndexSnapshot(manifest=manifest, ids=ids, payloads=payloads, vectors=vectors)
+
+
+def create_embeddings_model() -> Embeddings:
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from shared import llm_clients
+
+    return AzureOpenAIEmbeddings(
+        azure_deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+        openai_api_version=os.getenv("AZURE_OPENAI_VERSION"),
+        model=os.getenv("AZURE_OPENAI_EMBEDDING_MODEL"),
+        http_client=llm_clients.http_client(),
+        max_retries=llm_clients.sdk_max_retries(),
+        **llm_clients.azure_openai_credentials(),
+    )
+
+
+if __name__ == "__main__":
+    dotenv.load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Build a memory-mappable product index snapshot")
+    parser.add_argument("--products", default="products.json")
+    parser.add_argument("--out", default=os.getenv("PRODUCT_INDEX_PATH", DEFAULT_INDEX_PATH))
+    args = parser.parse_args()
+
+    from embedding_cache import CachedEmbeddings
+
+    started = time.perf_counter()
+    manifest = build_snapshot(args.products, CachedEmbeddings(create_embeddings_model()), args.out)
+    print(f"wrote {manifest['count']} products to {args.out} in {time.perf_counter() - started:.1f}s "
+          f"(catalog version {manifest['catalog_version'][:12]})")
@@ -0,0 +1,248 @@
+import argparse
+import contextvars
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+import dotenv
+import tiktoken
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from openai import RateLimitError
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Batch, Distance, PointIdsList, VectorParams
+
+from catalog import document_payload, iter_batches, iter_products, product_fingerprint, product_to_document
+
+encoding = tiktoken.get_encoding("cl100k_base")
+
+
+@dataclass
+class IngestStats:
+    docs: int = 0
+    tokens: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.docs / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.docs} docs in {self.batches} batches, {self.seconds:.1f}s, "
+                f"{self.docs_per_second:.1f} docs/s, {self.tokens_per_second:.0f} tokens/s, {self.retries} retries")
+
+
+def retry_after_seconds(error: RateLimitError, attempt: int) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    if "retry-after-ms" in headers:
+        return float(headers["retry-after-ms"]) / 1000
+    if "retry-after" in headers:
+        return float(headers["retry-after"])
+    return min(60.0, 2 ** attempt) + random.uniform(0, 1)
+
+
+def embed_with_backoff(embeddings: Embeddings, texts: List[str], stats: IngestStats, max_retries: int) -> List[List[float]]:
+    attempt = 0
+    while True:
+        try:
+            return embeddings.embed_documents(texts)
+        except RateLimitError as error:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            delay = retry_after_seconds(error, attempt)
+            stats.retries += 1
+            print(f"embedding rate limited, retrying in {delay:.1f}s (attempt {attempt}/{max_retries})")
+            time.sleep(delay)
+
+
+def ingest_catalog(
+    client: QdrantClient,
+    collection_name: str,
+    embeddings: Embeddings,
+    products_path: str = 'products.json',
+    batch_size: int = 64,
+    concurrency: int = 4,
+    max_retries: int = 8,
+    on_progress: Optional[Callable[[IngestStats], None]] = None,
+) -> IngestStats:
+    """
+    Streams the catalog from disk, embeds it in batches with bounded concurrency and
+    upserts every batch as soon as its vectors are ready.
+
+    At most `concurrency` batches are held in memory at any time, independent of catalog size.
+    """
+    stats = IngestStats()
+    started = time.perf_counter()
+
+    def embed(docs: List[Document]) -> Batch:
+        vectors = embed_with_backoff(embeddings, [doc.page_content for doc in docs], stats, max_retries)
+        return Batch(
+            ids=[doc.metadata["id"] for doc in docs],
+            vectors=vectors,
+            payloads=[document_payload(doc) for doc in docs],
+        )
+
+    def upsert(done: Set[Future], pending: Dict[Future, List[Document]]) -> None:
+        for future in done:
+            docs = pending.pop(future)
+            client.upsert(collection_name=collection_name, points=future.result())
+            stats.docs += len(docs)
+            stats.tokens += sum(len(encoding.encode(doc.page_content)) for doc in docs)
+            stats.batches += 1
+            stats.seconds = time.perf_counter() - started
+            if on_progress:
+                on_progress(stats)
+
+    pending: Dict[Future, List[Document]] = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for products in iter_batches(iter_products(products_path), batch_size):
+            docs = [product_to_document(obj) for obj in products]
+            # pool threads do not inherit context variables, the caller's LLM priority has to be carried over
+            pending[executor.submit(contextvars.copy_context().run, embed, docs)] = docs
+            if len(pending) >= concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                upsert(done, pending)
+        upsert(set(pending), pending)
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+@dataclass
+class SyncStats:
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        timings = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.stages.items())
+        return (f"{self.added} added, {self.updated} updated, {self.deleted} deleted, "
+                f"{self.unchanged} unchanged ({timings})")
+
+
+def indexed_fingerprints(client: QdrantClient, collection_name: str, page_size: int = 1000) -> Dict[str, Optional[str]]:
+    fingerprints = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=page_size,
+            offset=offset,
+            with_payload=["fingerprint"],
+            with_vectors=False,
+        )
+        for point in points:
+            fingerprints[str(point.id)] = (point.payload or {}).get("fingerprint")
+        if offset is None:
+            return fingerprints
+
+
+def sync_catalog(
+    client: QdrantClient,
+    collection_name: str,
+    embeddings: Embeddings,
+    products_path: str = 'products.json',
+    batch_size: int = 64,
+    max_retries: int = 8,
+) -> SyncStats:
+    """
+    Brings an existing collection in line with the catalog: only new or modified products
+    are embedded and upserted, products that left the catalog are deleted.
+    """
+    stats = SyncStats()
+    ingest_stats = IngestStats()
+
+    started = time.perf_counter()
+    indexed = indexed_fingerprints(client, collection_name)
+    stats.stages["scan"] = time.perf_counter() - started
+
+    stats.stages["diff"] = 0.0
+    stats.stages["embed"] = 0.0
+    stats.stages["upsert"] = 0.0
+    seen = set()
+    changed: List[Document] = []
+
+    def flush() -> None:
+        embed_started = time.perf_counter()
+        vectors = embed_with_backoff(embeddings, [doc.page_content for doc in changed], ingest_stats, max_retries)
+        stats.stages["embed"] += time.perf_counter() - embed_started
+        upsert_started = time.perf_counter()
+        client.upsert(collection_name=collection_name, points=Batch(
+            ids=[doc.metadata["id"] for doc in changed],
+            vectors=vectors,
+            payloads=[document_payload(doc) for doc in changed],
+        ))
+        stats.stages["upsert"] += time.perf_counter() - upsert_started
+        changed.clear()
+
+    started = time.perf_counter()
+    for obj in iter_products(products_path):
+        doc = product_to_document(obj)
+        id = doc.metadata["id"]
+        seen.add(id)
+        if id not in indexed:
+            stats.added += 1
+        elif indexed[id] != product_fingerprint(doc):
+            stats.updated += 1
+        else:
+            stats.unchanged += 1
+            continue
+        changed.append(doc)
+        if len(changed) >= batch_size:
+            flush()
+    if changed:
+        flush()
+    # the catalog pass minus the embedding and upsert work done while streaming through it
+    stats.stages["diff"] = time.perf_counter() - started - stats.stages["embed"] - stats.stages["upsert"]
+
+    started = time.perf_counter()
+    removed = [id for id in indexed if id not in seen]
+    if removed:
+        client.delete(collection_name=collection_name, points_selector=PointIdsList(points=removed))
+    stats.deleted = len(removed)
+    stats.stages["delete"] = time.perf_counter() - started
+    return stats
+
+
+if __name__ == "__main__":
+    dotenv.load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Stream the product catalog into a Qdrant collection")
+    parser.add_argument("--products", default="products.json")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL"), required=os.getenv("QDRANT_URL") is None)
+    parser.add_argument("--collection", default="products")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sync", action="store_true", help="only embed new or changed products and delete removed ones")
+    args = parser.parse_args()
+
+    from embedding_cache import CachedEmbeddings
+    from index_snapshot import create_embeddings_model
+
+    client = QdrantClient(url=args.qdrant_url)
+    if not client.collection_exists(args.collection):
+        client.create_collection(
+            collection_name=args.collection,
+            vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
+        )
+
+    embeddings = CachedEmbeddings(create_embeddings_model())
+    if args.sync:
+        print("synced " + str(sync_catalog(client, args.collection, embeddings, args.products, batch_size=args.batch_size)))
+    else:
+        stats = ingest_catalog(client, args.collection, embeddings, args.products,
+                               batch_size=args.batch_size, concurrency=args.concurrency,
+                               on_progress=lambda progress: print("ingesting: " + str(progress)))
+        print("ingested " + str(stats))
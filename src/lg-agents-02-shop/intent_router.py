@@ -0,0 +1,127 @@
+import asyncio
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+PRODUCT_SEARCH = "product_search"
+OTHER = "other"
+
+# labeled example turns, one centroid is computed per intent
+INTENT_EXAMPLES: Dict[str, List[str]] = {
+    PRODUCT_SEARCH: [
+        "I am looking for a dining table for six people",
+        "Do you have a king size bed frame?",
+        "I need a sofa that fits into a small living room",
+        "Show me office chairs with armrests",
+        "Which wardrobes are less than 100 cm wide?",
+        "I want a white bookshelf",
+        "Can you recommend a desk for my kids room?",
+        "Something to store my shoes in the hallway",
+        "A bigger one please, at least 2 meters long",
+        "Do you have that in oak?",
+    ],
+    OTHER: [
+        "Hello",
+        "Thank you, that is all",
+        "How do I assemble the bed frame?",
+        "Where can I find the assembly manual?",
+        "Which screws do I need for step 4?",
+        "What are your opening hours?",
+        "Bye",
+        "Can I return a product I bought last week?",
+        "Where is my order?",
+        "Yes, I am happy with that",
+    ],
+}
+
+PRODUCT_WORDS = re.compile(
+    r"\b(bed|beds|table|tables|sofa|sofas|couch|chair|chairs|desk|desks|wardrobe|wardrobes|shelf|shelves|"
+    r"bookshelf|bookcase|cabinet|cabinets|dresser|drawer|drawers|lamp|lamps|mattress|mattresses|stool|stools|"
+    r"bench|rug|rugs|mirror|armchair|nightstand|sideboard)\b",
+    re.IGNORECASE,
+)
+SEEKING_WORDS = re.compile(r"\b(looking for|search|find|need|want|recommend|show me|do you have|buy)\b", re.IGNORECASE)
+OTHER_WORDS = re.compile(r"\b(assemble|assembly|manual|instructions?|screws?|return|refund|order|delivery|thanks?|bye)\b", re.IGNORECASE)
+
+
+class IntentRouter:
+    """
+    Cheap local classifier for user turns that decides whether a turn clearly asks for products.
+
+    Turns that name a product and ask for it are routed by keywords alone. Everything else is
+    embedded and compared with the centroids of the labeled examples. The router only answers
+    when the best centroid is similar enough and ahead of the runner-up by `margin`, otherwise
+    it returns None and the caller falls back to the LLM.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        examples: Optional[Dict[str, List[str]]] = None,
+        threshold: Optional[float] = None,
+        margin: Optional[float] = None,
+    ):
+        self.embeddings = embeddings
+        self.examples = examples or INTENT_EXAMPLES
+        self.threshold = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.5")) if threshold is None else threshold
+        self.margin = float(os.getenv("INTENT_ROUTER_MARGIN", "0.05")) if margin is None else margin
+        self.labels = list(self.examples)
+        self._centroids: Optional[np.ndarray] = None
+        self.keyword_routes = 0
+        self.embedding_routes = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def centroids(self) -> np.ndarray:
+        if self._centroids is None:
+            texts = [text for label in self.labels for text in self.examples[label]]
+            vectors = self._normalize(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+            rows, start = [], 0
+            for label in self.labels:
+                end = start + len(self.examples[label])
+                rows.append(vectors[start:end].mean(axis=0))
+                start = end
+            self._centroids = self._normalize(np.stack(rows))
+        return self._centroids
+
+    def _keyword_route(self, text: str) -> Optional[str]:
+        if PRODUCT_WORDS.search(text) and SEEKING_WORDS.search(text) and not OTHER_WORDS.search(text):
+            self.keyword_routes += 1
+            return PRODUCT_SEARCH
+        return None
+
+    def route(self, text: str) -> Optional[str]:
+        return self._keyword_route(text) or self._nearest_centroid(self.embeddings.embed_query(text))
+
+    async def aroute(self, text: str) -> Optional[str]:
+        if intent := self._keyword_route(text):
+            return intent
+        if self._centroids is None:
+            await asyncio.to_thread(self.centroids)
+        return self._nearest_centroid(await self.embeddings.aembed_query(text))
+
+    def _nearest_centroid(self, vector: List[float]) -> Optional[str]:
+        query = self._normalize(np.asarray(vector, dtype=np.float32))
+        similarities = self.centroids() @ query
+        ranked = np.argsort(-similarities)
+        best = similarities[ranked[0]]
+        runner_up = similarities[ranked[1]] if len(ranked) > 1 else -1.0
+        if best >= self.threshold and best - runner_up >= self.margin:
+            self.embedding_routes += 1
+            return self.labels[ranked[0]]
+        self.fallbacks += 1
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "keyword_routes": self.keyword_routes,
+            "embedding_routes": self.embedding_routes,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,268 @@
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from index_snapshot import IndexSnapshot
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+
+# rows scored at once, keeps the temporary float32 copy of quantized blocks small
+BLOCK_SIZE = 8192
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Brute-force cosine vector store over a contiguous NumPy matrix.
+
+    Rows are normalized on insert, so a query is answered with one matrix-vector product and
+    an `argpartition` for the top k. Vectors can be kept as float16 or as int8 with a per-row
+    scale. A float32 store loaded from a snapshot searches the memory-mapped snapshot itself,
+    with the inverse norms as row scales, until it is changed. For quantized stores backed by
+    a snapshot, the best `k * rescore_factor` candidates are rescored against the
+    full-precision memory-mapped vectors.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        dimension: int = 1536,
+        quantization: str = "float32",
+        rescore_factor: int = 4,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got {quantization}")
+        self.embedding = embedding
+        self.dimension = dimension
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self._matrix = np.zeros((0, dimension), dtype=np.int8 if quantization == "int8" else quantization)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._size = 0
+        self._ids: List[str] = []
+        self._payloads: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        # full-precision vectors used for rescoring, row-aligned with the matrix
+        self._full: Optional[np.ndarray] = None
+        # the snapshot row of every matrix row, ids that repeat in the snapshot keep their last row
+        self._full_rows: Optional[np.ndarray] = None
+        # rows of a snapshot whose id appears again in a later row, they are never returned
+        self._shadowed = np.zeros(0, dtype=np.int64)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _mapped(self) -> bool:
+        return isinstance(self._matrix, np.memmap)
+
+    def _index_rows(self) -> None:
+        self._rows = {id: row for row, id in enumerate(self._ids)}
+        self._shadowed = np.array([row for row, id in enumerate(self._ids) if self._rows[id] != row], dtype=np.int64)
+
+    def _reserve(self, count: int) -> None:
+        if self._size + count <= self._matrix.shape[0]:
+            return
+        capacity = max(self._size + count, 2 * self._matrix.shape[0], 1024)
+        matrix = np.zeros((capacity, self.dimension), dtype=self._matrix.dtype)
+        matrix[:self._size] = self._matrix[:self._size]
+        scales = np.zeros(capacity, dtype=np.float32)
+        scales[:self._size] = self._scales[:self._size]
+        self._matrix, self._scales = matrix, scales
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(self._matrix.dtype), np.ones(len(vectors), dtype=np.float32)
+
+    def add_vectors(self, ids: List[str], vectors: Any, payloads: List[Dict[str, Any]]) -> List[str]:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # an id that repeats in the batch keeps its last vector, as with separate calls
+        last = {id: index for index, id in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids, vectors, payloads = [ids[index] for index in keep], vectors[keep], [payloads[index] for index in keep]
+        encoded, scales = self._encode(vectors)
+        if self._mapped():
+            # the snapshot is read-only, changes go to a copy in memory
+            self._matrix = np.array(self._matrix[:self._size])
+        # existing ids are updated in place, new ids are appended
+        new_rows = [index for index, id in enumerate(ids) if id not in self._rows]
+        for index, id in enumerate(ids):
+            if id in self._rows:
+                row = self._rows[id]
+                self._matrix[row] = encoded[index]
+                self._scales[row] = scales[index]
+                self._payloads[row] = payloads[index]
+        self._reserve(len(new_rows))
+        start = self._size
+        self._matrix[start:start + len(new_rows)] = encoded[new_rows]
+        self._scales[start:start + len(new_rows)] = scales[new_rows]
+        for offset, index in enumerate(new_rows):
+            self._rows[ids[index]] = start + offset
+            self._ids.append(ids[index])
+            self._payloads.append(payloads[index])
+        self._size += len(new_rows)
+        # rescoring vectors no longer line up with the matrix
+        self._full = None
+        return list(ids)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(len(self._ids) + index) for index in range(len(texts))]
+        vectors = self.embedding.embed_documents(texts)
+        payloads = [{"page_content": text, "metadata": metadata} for text, metadata in zip(texts, metadatas)]
+        return self.add_vectors(ids, vectors, payloads)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        removed = set(ids or [])
+        keep = [row for row, id in enumerate(self._ids) if id not in removed]
+        self._matrix = self._matrix[keep]
+        self._scales = self._scales[keep]
+        self._ids = [self._ids[row] for row in keep]
+        self._payloads = [self._payloads[row] for row in keep]
+        self._index_rows()
+        self._size = len(keep)
+        self._full = None
+        return True
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        if self.quantization == "float32":
+            return (self._matrix[:self._size] @ query) * self._scales[:self._size]
+        scores = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, BLOCK_SIZE):
+            block = self._matrix[start:min(start + BLOCK_SIZE, self._size)].astype(np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores * self._scales[:self._size]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Set[str]] = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Returns the k most similar documents, optionally only among the ids in `filter`.
+        """
+        if self._size == 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        scores = self._scores(query)
+        scores[self._shadowed] = -np.inf
+
+        available = len(self._rows)
+        if filter is not None:
+            mask = np.zeros(self._size, dtype=bool)
+            mask[[self._rows[id] for id in filter if id in self._rows]] = True
+            scores[~mask] = -np.inf
+            available = int(mask.sum())
+            if available == 0:
+                return []
+
+        candidates = k if self._full is None or self.quantization == "float32" else k * self.rescore_factor
+        candidates = min(candidates, available)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        if candidates > k:
+            full = np.asarray(self._full[self._full_rows[top]], dtype=np.float32)
+            scores[top] = (full @ query) / np.linalg.norm(full, axis=1)
+        top = top[np.argsort(-scores[top])][:k]
+
+        return [
+            (Document(page_content=self._payloads[row]["page_content"], metadata=self._payloads[row]["metadata"]), float(scores[row]))
+            for row in top
+        ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Set[str]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Set[str]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Set[str]] = None, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        return [
+            Document(page_content=self._payloads[row]["page_content"], metadata=self._payloads[row]["metadata"])
+            for row in (self._rows[id] for id in ids if id in self._rows)
+        ]
+
+    def _select_relevance_score_fn(self):
+        # scores already are cosine similarities
+        return lambda score: score
+
+    def memory_bytes(self) -> int:
+        """
+        Bytes of the vectors held in memory, without the memory-mapped snapshot.
+        """
+        matrix = 0 if self._mapped() else self._matrix[:self._size].nbytes
+        return matrix + self._scales[:self._size].nbytes
+
+    def mapped_bytes(self) -> int:
+        """
+        Bytes of the memory-mapped snapshot the store reads from, paged in by the OS as needed.
+        """
+        if self._mapped():
+            return self._matrix[:self._size].nbytes
+        return 0 if self._full is None else self._full.nbytes
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        snapshot: IndexSnapshot,
+        embedding: Embeddings,
+        quantization: str = "float32",
+        rescore_factor: int = 4,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding, snapshot.manifest["dimension"], quantization, rescore_factor)
+        if quantization == "float32":
+            # the mapped rows are not normalized, the inverse norms are applied to the scores
+            store._matrix = snapshot.vectors
+            store._scales = np.empty(len(snapshot.ids), dtype=np.float32)
+            for start in range(0, len(snapshot.ids), BLOCK_SIZE):
+                norms = np.linalg.norm(snapshot.vectors[start:start + BLOCK_SIZE], axis=1)
+                store._scales[start:start + len(norms)] = 1 / np.where(norms == 0, 1, norms)
+            store._ids = list(snapshot.ids)
+            store._payloads = list(snapshot.payloads)
+            store._size = len(snapshot.ids)
+            store._index_rows()
+            return store
+        store._reserve(len(snapshot.ids))
+        for start in range(0, len(snapshot.ids), BLOCK_SIZE):
+            end = start + BLOCK_SIZE
+            store.add_vectors(snapshot.ids[start:end], snapshot.vectors[start:end], snapshot.payloads[start:end])
+        # the memory-mapped snapshot stays on disk and is only paged in for rescoring
+        last = {id: row for row, id in enumerate(snapshot.ids)}
+        store._full = snapshot.vectors
+        store._full_rows = np.array([last[id] for id in store._ids], dtype=np.int64)
+        return store
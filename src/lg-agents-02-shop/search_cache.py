@@ -0,0 +1,110 @@
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from hybrid_search import Filters, parse_filters
+
+# "red shoes size 42" and "red shoes size 44" embed above any useful threshold, so queries with
+# numbers (sizes, measurements, prices) are never answered from the cache
+NUMBER_PATTERN = re.compile(r"[0-9]")
+
+
+def is_cacheable(query: str, filters: Optional[Filters] = None) -> bool:
+    """
+    Whether the results of `query` may be shared with similar queries, which is not the case
+    when it is filtered or names a number.
+    """
+    return not filters and not parse_filters(query) and not NUMBER_PATTERN.search(query)
+
+
+class SemanticSearchCache:
+    """
+    Reuses the top-k results of an earlier search when a new query vector is close enough to
+    the query vector of that search, so near-duplicate queries skip the vector store.
+    Results are stored as scored (document, score) pairs.
+
+    Entries are bounded and evicted least recently used first. All entries are dropped when
+    the catalog version changes. `max_entries=0` disables the cache.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, max_entries: Optional[int] = None):
+        self.threshold = float(os.getenv("SEARCH_CACHE_THRESHOLD", "0.97")) if threshold is None else threshold
+        self.max_entries = int(os.getenv("SEARCH_CACHE_SIZE", "256")) if max_entries is None else max_entries
+        self.catalog_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._results: List[Optional[List[Tuple[Document, float]]]] = [None] * self.max_entries
+        self._k = np.zeros(self.max_entries, dtype=np.int32)
+        self._last_used = np.zeros(self.max_entries, dtype=np.int64)
+        self._size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _check_version(self, catalog_version: str) -> None:
+        if catalog_version != self.catalog_version:
+            if self._size:
+                self.invalidations += 1
+            self.catalog_version = catalog_version
+            self._size = 0
+            self._results = [None] * self.max_entries
+
+    def lookup(self, vector: List[float], k: int, catalog_version: str) -> Optional[List[Tuple[Document, float]]]:
+        if not self.max_entries:
+            return None
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version(catalog_version)
+            self._clock += 1
+            if self._size:
+                similarities = self._vectors[:self._size] @ query
+                # only entries that hold at least k results can answer this query
+                similarities[self._k[:self._size] < k] = -1.0
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._last_used[best] = self._clock
+                    self.hits += 1
+                    return self._results[best][:k]
+            self.misses += 1
+            return None
+
+    def store(self, vector: List[float], k: int, results: List[Tuple[Document, float]], catalog_version: str) -> None:
+        if not self.max_entries:
+            return
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version(catalog_version)
+            self._clock += 1
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._vectors[slot] = query
+            self._results[slot] = list(results)
+            self._k[slot] = k
+            self._last_used[slot] = self._clock
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": self._size,
+        }
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import dotenv
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+from shop_graph import stream_turn
+from shop_resources import Shop, build_shop, llm_clients
+
+dotenv.load_dotenv()
+
+shop: Optional[Shop] = None
+startup_seconds: Optional[float] = None
+# why build_shop failed, /health reports it instead of starting forever
+startup_error: Optional[str] = None
+# one turn at a time per conversation, locks disappear with their last waiting request
+session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+async def start() -> None:
+    global shop, startup_seconds
+    started = time.perf_counter()
+    # the graph, the LLM clients and the product index are built once per process
+    shop = await asyncio.to_thread(build_shop)
+    startup_seconds = time.perf_counter() - started
+    print("shop ready after ", round(startup_seconds, 2), "s")
+
+
+def startup_done(task: "asyncio.Task[None]") -> None:
+    global startup_error
+    if task.cancelled() or task.exception() is None:
+        return
+    error = task.exception()
+    startup_error = f"{type(error).__name__}: {error}"
+    print("shop failed to start: ", startup_error)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # start in the background, so /health answers while the index is loaded
+    startup = asyncio.create_task(start())
+    startup.add_done_callback(startup_done)
+    yield
+    startup.cancel()
+
+
+api = FastAPI(title="lg-agents-02-shop", lifespan=lifespan)
+
+
+class Turn(BaseModel):
+    message: str
+
+
+def ready_shop() -> Shop:
+    if startup_error is not None:
+        raise HTTPException(status_code=500, detail="startup failed: " + startup_error)
+    if shop is None:
+        raise HTTPException(status_code=503, detail="starting")
+    return shop
+
+
+@api.get("/health")
+async def health() -> JSONResponse:
+    if startup_error is not None:
+        return JSONResponse({"status": "failed", "error": startup_error}, status_code=500)
+    if shop is None:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return JSONResponse({
+        "status": "ready",
+        "startup_seconds": startup_seconds,
+        "startup_phases": shop.startup,
+        "checkpointer": shop.memory.stats(),
+        "embedding_cache": shop.embeddings_model.stats(),
+        "search_cache": shop.search.search_cache.stats(),
+        "llm_connections": llm_clients.pool_stats(),
+        "llm_rate_limiter": llm_clients.limiter().stats(),
+    })
+
+
+@api.post("/warmup")
+async def warmup() -> Dict[str, Any]:
+    """
+    Runs one query through the embedding, the vector search and the intent router, so the first
+    user turn does not pay for connection setup and lazily built indexes.
+    """
+    current = ready_shop()
+    timings = {}
+    started = time.perf_counter()
+    await current.search.asearch("dining table")
+    timings["search_seconds"] = time.perf_counter() - started
+    if current.intent_router is not None:
+        started = time.perf_counter()
+        await current.intent_router.aroute("hello")
+        timings["intent_router_seconds"] = time.perf_counter() - started
+    return timings
+
+
+def server_sent_event(event: Dict[str, Any]) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+@api.post("/sessions/{session_id}/turns")
+async def turn(session_id: str, turn: Turn) -> StreamingResponse:
+    """
+    Runs one chat turn of a conversation and streams its events as server-sent events.
+    """
+    current = ready_shop()
+    config = {"configurable": {"thread_id": session_id}, "recursion_limit": 100}
+
+    async def events() -> AsyncIterator[str]:
+        lock = session_locks.get(session_id)
+        if lock is None:
+            lock = session_locks[session_id] = asyncio.Lock()
+        async with lock:
+            try:
+                async for event in stream_turn(current.app, config, turn.message):
+                    yield server_sent_event(event)
+            except Exception as error:
+                print("turn failed for session ", session_id, ": ", repr(error))
+                yield server_sent_event({"event": "error", "detail": str(error)})
+            yield server_sent_event({"event": "done"})
+        print("checkpointer: ", current.memory.stats())
+        print("embedding cache: ", current.embeddings_model.stats(), ", search cache: ", current.search.search_cache.stats())
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+if __name__ == "__main__":
+    uvicorn.run(api, host="0.0.0.0", port=int(os.getenv("PORT", "8080")))
@@ -0,0 +1,429 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Annotated, Any, AsyncIterator, Dict, List, Literal, Optional, Tuple, TypedDict
+
+import tiktoken
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.tools import StructuredTool
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.errors import NodeInterrupt
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import AnyMessage, add_messages
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.prebuilt import ToolNode
+
+from catalog import summarize
+from conversation_window import ConversationWindow, transcript
+from hybrid_search import parse_filters
+from intent_router import PRODUCT_SEARCH, IntentRouter
+from shop_search import ProductSearch
+
+# Define the state for the agent
+class State(TypedDict):
+    messages: Annotated[list[AnyMessage], add_messages]
+    # rolling summary of the first `summarized` messages, see ConversationWindow
+    summary: str
+    summarized: int
+
+@dataclass
+class ProductSearchResult:
+    id: str
+    title: str
+    url: str
+    description: str
+    measurements: str
+    product_image_url: str
+
+@dataclass
+class ProductSummary:
+    id: str
+    title: str
+    summary: str
+    measurements: str
+
+@dataclass
+class ProductSearchGroup:
+    query: str
+    results: List[ProductSummary]
+    # products that also match this query but were already returned for an earlier one
+    also_matching: List[str]
+
+# search results are kept short because every tool message is sent along with all later LLM calls
+encoding = tiktoken.get_encoding("cl100k_base")
+search_result_token_budget = int(os.getenv("SEARCH_RESULT_TOKEN_BUDGET", "800"))
+search_score_gap = float(os.getenv("SEARCH_SCORE_GAP", "0.3"))
+
+def to_search_result(result: Document) -> ProductSearchResult:
+    return ProductSearchResult(
+        id=result.metadata["id"],
+        title=result.metadata["title"],
+        url=result.metadata["url"],
+        description=result.page_content,
+        measurements=result.metadata["measurements"],
+        product_image_url=result.metadata["product-image-url"])
+
+def to_summary(result: Document) -> ProductSummary:
+    return ProductSummary(
+        id=result.metadata["id"],
+        title=result.metadata["title"],
+        # indexes built before summaries were stored fall back to summarizing on the fly
+        summary=result.metadata.get("summary") or summarize(result.page_content),
+        measurements=result.metadata["measurements"])
+
+def adaptive_cutoff(results: List[Tuple[Document, float]], fused: bool = False) -> List[Tuple[Document, float]]:
+    # stop at the first score drop larger than search_score_gap of the best score. Fused scores
+    # halve from the first result found by both searches to one found by only one of them, so
+    # they are only cut by the token budget
+    if fused:
+        return results
+    for index in range(1, len(results)):
+        if results[index - 1][1] - results[index][1] > search_score_gap * results[0][1]:
+            return results[:index]
+    return results
+
+def within_budget(summaries: List[ProductSummary], budget: int) -> List[ProductSummary]:
+    kept = []
+    used = 0
+    for summary in summaries:
+        tokens = len(encoding.encode(json.dumps(asdict(summary))))
+        if kept and used + tokens > budget:
+            break
+        kept.append(summary)
+        used += tokens
+    return kept
+
+def group_results(queries: List[str], batch: List[List[Tuple[Document, float]]], fused: bool = False) -> List[ProductSearchGroup]:
+    seen = set()
+    groups = []
+    budget = search_result_token_budget // max(1, len(queries))
+    for query, results in zip(queries, batch):
+        group = ProductSearchGroup(query=query, results=[], also_matching=[])
+        for result, _ in adaptive_cutoff(results, fused):
+            id = result.metadata["id"]
+            if id in seen:
+                group.also_matching.append(id)
+            else:
+                seen.add(id)
+                group.results.append(to_summary(result))
+        group.results = within_budget(group.results, budget)
+        groups.append(group)
+    return groups
+
+def count_tokens(messages: List[BaseMessage]) -> int:
+    tokens = 0
+    for message in messages:
+        tokens += len(encoding.encode(str(message.content)))
+        if isinstance(message, AIMessage) and message.tool_calls:
+            tokens += len(encoding.encode(json.dumps(message.tool_calls)))
+    return tokens
+
+ORCHESTRATOR_PROMPT = """Your are an orchestrator agent that manages the comunication between the user and the provided agents.
+    Use the following prefixes to redirect the flow of information. DO NOT ask the user to detail his request. This needs to be delegated to the other agents.
+
+    - 'AskAgent-ProductSearchAgent:' for asking the product search agent to search for product information.
+    - 'AskAgent-ProductAssemblyAgent:' for asking the product assembly agent to read the manual and provide the user with the information they need.
+
+    If you are done, calling your agents, prepare an answer to the users, containing all relevant information. Ask the human by calling the appropriate tool.
+    Close the conversation if the user is satisfied or if the user is not satisfied, ask the user for more information and continue the conversation.
+
+    """
+
+PRODUCT_SEARCH_PROMPT = """Your are an agent that searches for products and returns the results to the user or other agents'.
+    Use the provided tools to search for the products the user is looking for.
+    If the user is looking for several different products, search for all of them at once with the batch search tool.
+    The search tools return short summaries, only load the full details of a product when you need them.
+
+    Ask the user for the product they are looking for and use the search tools to find the relevant information. Try to push the user
+    for more detailed information before doing the search. Call the corresponding tool to initiate the interaction with the user'.
+
+    If your are satisfied with your results, send out a final questions to the user to ask if he is also satisfied.
+    If yes, send out your final answer with a prefix 'Product-Search-Agent-Results:'.
+
+    Iterate if required.
+    """
+
+SUMMARY_PROMPT = """You maintain a short summary of a conversation between a customer and a furniture shop assistant.
+    Extend the existing summary with the new messages. Keep what the customer is looking for, their requirements
+    such as sizes, colors and budget, and the titles and ids of the products that were suggested. Reply with the summary only.
+    """
+
+
+def build_workflow(llm: BaseChatModel, search: ProductSearch, intent_router: Optional[IntentRouter] = None) -> StateGraph:
+    """
+    Builds the shop graph. Every node and tool has a blocking and an async implementation, so the
+    compiled graph can be driven with `stream` as well as with `astream` on an event loop.
+    """
+
+    #-------------------------------------------------------------------------------------------
+
+    def product_search_tool(query: str, measurement_filter: Optional[str] = None) -> List[ProductSummary]:
+        """
+        Search for relevant product information in the vector index based on the user's query.
+
+        Args:
+            query (str): The input query. This is used to search the vector index and matches product titles, descriptions and measurements.
+            measurement_filter (Optional[str]): Optional constraints on the product measurements, e.g. "width <= 90 cm, length >= 200 cm".
+
+        Returns:
+            List[ProductSummary]: Short summaries of the matching products. Use product_details_tool for the full details of a product.
+
+        """
+        print("Searching for products with query: ", query, ", filter: ", measurement_filter)
+        results = adaptive_cutoff(search.search(query, filters=parse_filters(measurement_filter)), search.fused)
+        return within_budget([to_summary(result) for result, _ in results], search_result_token_budget)
+
+    async def aproduct_search_tool(query: str, measurement_filter: Optional[str] = None) -> List[ProductSummary]:
+        print("Searching for products with query: ", query, ", filter: ", measurement_filter)
+        results = adaptive_cutoff(await search.asearch(query, filters=parse_filters(measurement_filter)), search.fused)
+        return within_budget([to_summary(result) for result, _ in results], search_result_token_budget)
+
+    def product_batch_search_tool(queries: List[str]) -> List[ProductSearchGroup]:
+        """
+        Search for several products at once. Use this instead of calling product_search_tool repeatedly
+        when the user is looking for more than one kind of product.
+
+        Args:
+            queries (List[str]): One search query per product the user is looking for.
+
+        Returns:
+            List[ProductSearchGroup]: Short summaries of the matching products grouped per query. A product is only listed once,
+            later queries that match it again reference its id in also_matching.
+
+        """
+        print("Searching for products with queries: ", queries)
+        return group_results(queries, search.search_batch(queries), search.fused)
+
+    async def aproduct_batch_search_tool(queries: List[str]) -> List[ProductSearchGroup]:
+        print("Searching for products with queries: ", queries)
+        return group_results(queries, await search.asearch_batch(queries), search.fused)
+
+    def product_details_tool(product_id: str) -> Optional[ProductSearchResult]:
+        """
+        Get the full details of a single product, including its complete description, url and image url.
+
+        Args:
+            product_id (str): The id of a product returned by one of the search tools.
+
+        Returns:
+            ProductSearchResult: The full product information, or None if there is no product with this id.
+
+        """
+        print("Loading product details for: ", product_id)
+        product = search.get_product(product_id)
+        return to_search_result(product) if product is not None else None
+
+    async def aproduct_details_tool(product_id: str) -> Optional[ProductSearchResult]:
+        print("Loading product details for: ", product_id)
+        product = await search.aget_product(product_id)
+        return to_search_result(product) if product is not None else None
+
+    def ask_human(question: str):
+        """
+        Ask the user for more information.
+        """
+        raise NodeInterrupt(f"AskHuman: {question}")
+
+    async def aask_human(question: str):
+        raise NodeInterrupt(f"AskHuman: {question}")
+
+    search_tools = [
+        StructuredTool.from_function(product_search_tool, coroutine=aproduct_search_tool),
+        StructuredTool.from_function(product_batch_search_tool, coroutine=aproduct_batch_search_tool),
+        StructuredTool.from_function(product_details_tool, coroutine=aproduct_details_tool),
+        StructuredTool.from_function(ask_human, coroutine=aask_human),
+    ]
+
+    #-------------------------------------------------------------------------------------------
+
+    # the summary is internal and must not be streamed into the chat
+    summary_llm = llm.with_config(tags=[TAG_NOSTREAM])
+
+    def summary_messages(summary: str, messages: List[BaseMessage]):
+        return [("system", SUMMARY_PROMPT), ("user", f"Summary so far: {summary or 'none'}\n\nNew messages:\n{transcript(messages)}")]
+
+    def summarize_conversation(summary: str, messages: List[BaseMessage]) -> str:
+        return summary_llm.invoke(summary_messages(summary, messages)).content
+
+    async def asummarize_conversation(summary: str, messages: List[BaseMessage]) -> str:
+        return (await summary_llm.ainvoke(summary_messages(summary, messages))).content
+
+    conversation_window = ConversationWindow(summarize_conversation, count_tokens, asummarize=asummarize_conversation)
+
+    #-------------------------------------------------------------------------------------------
+
+    orchestrator_call = ChatPromptTemplate.from_messages(
+        [("system", ORCHESTRATOR_PROMPT), ("placeholder", "{input}")]
+    ) | llm
+
+    def product_inquiry_orchestrator(state: State, config: RunnableConfig) -> dict:
+        messages, updates = conversation_window.prepare(state, "product_inquiry_orchestrator")
+        response = orchestrator_call.invoke({"input": messages}, config)
+        if response.usage_metadata:
+            print("usage product_inquiry_orchestrator: ", response.usage_metadata)
+        return {"messages": [response], **updates}
+
+    async def aproduct_inquiry_orchestrator(state: State, config: RunnableConfig) -> dict:
+        messages, updates = await conversation_window.aprepare(state, "product_inquiry_orchestrator")
+        response = await orchestrator_call.ainvoke({"input": messages}, config)
+        if response.usage_metadata:
+            print("usage product_inquiry_orchestrator: ", response.usage_metadata)
+        return {"messages": [response], **updates}
+
+    search_agent_call = ChatPromptTemplate.from_messages(
+        [("system", PRODUCT_SEARCH_PROMPT), ("placeholder", "{input}")]
+    ) | llm.bind_tools(search_tools, tool_choice="auto")
+
+    def product_search_agent(state: State, config: RunnableConfig) -> dict:
+        messages, updates = conversation_window.prepare(state, "product_search_agent")
+        response = search_agent_call.invoke({"input": messages}, config)
+        if response.usage_metadata:
+            print("usage product_search_agent: ", response.usage_metadata)
+        return {"messages": [response], **updates}
+
+    async def aproduct_search_agent(state: State, config: RunnableConfig) -> dict:
+        messages, updates = await conversation_window.aprepare(state, "product_search_agent")
+        response = await search_agent_call.ainvoke({"input": messages}, config)
+        if response.usage_metadata:
+            print("usage product_search_agent: ", response.usage_metadata)
+        return {"messages": [response], **updates}
+
+    #-------------------------------------------------------------------------------------------
+
+    def agent_tool_router(state: State):
+        messages = state["messages"]
+        last_message = messages[-1]
+        if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
+            return "tool_node"
+        elif isinstance(last_message, HumanMessage):
+            return "agent_name"
+        return "end_node"
+
+    def route_intent(intent: Optional[str]) -> Literal["product_search_agent", "product_inquiry_orchestrator"]:
+        print("intent router: ", intent, intent_router.stats())
+        if intent == PRODUCT_SEARCH:
+            return "product_search_agent"
+        return "product_inquiry_orchestrator"
+
+    # clearly product seeking turns skip the orchestrator LLM call, unsure ones still go through it
+    def user_turn_router(state: State) -> Literal["product_search_agent", "product_inquiry_orchestrator"]:
+        if intent_router is None:
+            return "product_inquiry_orchestrator"
+        return route_intent(intent_router.route(state["messages"][-1].content))
+
+    async def auser_turn_router(state: State) -> Literal["product_search_agent", "product_inquiry_orchestrator"]:
+        if intent_router is None:
+            return "product_inquiry_orchestrator"
+        return route_intent(await intent_router.aroute(state["messages"][-1].content))
+
+    def orchestrator_router(state: State) -> Literal["product_search_agent", "product_inquiry_orchestrator", "__end__"]:
+        last_message = state["messages"][-1]
+        if isinstance(last_message, HumanMessage):
+            return user_turn_router(state)
+        if "AskAgent-ProductSearchAgent:" in last_message.content:
+            return "product_search_agent"
+        return "__end__"
+
+    async def aorchestrator_router(state: State) -> Literal["product_search_agent", "product_inquiry_orchestrator", "__end__"]:
+        last_message = state["messages"][-1]
+        if isinstance(last_message, HumanMessage):
+            return await auser_turn_router(state)
+        if "AskAgent-ProductSearchAgent:" in last_message.content:
+            return "product_search_agent"
+        return "__end__"
+
+    #-------------------------------------------------------------------------------------------
+
+    workflow = StateGraph(State)
+    workflow.add_node("product_inquiry_orchestrator", RunnableLambda(product_inquiry_orchestrator, afunc=aproduct_inquiry_orchestrator))
+    workflow.add_node("product_search_agent", RunnableLambda(product_search_agent, afunc=aproduct_search_agent))
+    workflow.add_node("search_tools", ToolNode(search_tools))
+
+    # Specify the edges between the nodes
+    workflow.add_conditional_edges(
+        START,
+        RunnableLambda(user_turn_router, afunc=auser_turn_router),
+        ["product_search_agent", "product_inquiry_orchestrator"],
+    )
+    workflow.add_conditional_edges(
+        "product_inquiry_orchestrator",
+        RunnableLambda(orchestrator_router, afunc=aorchestrator_router),
+        ["product_search_agent", "product_inquiry_orchestrator", END],
+    )
+    workflow.add_conditional_edges(
+        "product_search_agent",
+        agent_tool_router,
+        {
+            "end_node": "product_inquiry_orchestrator",
+            "tool_node": "search_tools",
+            "agent_name": "product_search_agent"
+        }
+    )
+    workflow.add_edge("search_tools", "product_search_agent")
+    return workflow
+
+
+def visible_text(message: AIMessageChunk) -> str:
+    if message.content:
+        return str(message.content)
+    # chunks merge into partially parsed tool calls
+    for tool_call in message.tool_calls:
+        if tool_call["name"] == "ask_human":
+            return tool_call["args"].get("question", "")
+    return ""
+
+
+async def stream_turn(app: CompiledStateGraph, config: RunnableConfig, text: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs one user turn and yields chat events, used by the Streamlit app and by the headless server:
+
+    - {"event": "token", "id", "node", "delta"} while a message streams, or "text" instead of
+      "delta" when the streamed text had to be replaced,
+    - {"event": "message", "id", "node", "content"} for every finished answer or ask_human question.
+    """
+    await app.aupdate_state(config, {"messages": [{"role": "user", "content": text}]})
+
+    # tokens are sent while they arrive, the node updates only report the finished messages
+    streamed: Dict[str, AIMessageChunk] = {}
+    sent: Dict[str, str] = {}
+    started = time.perf_counter()
+    async for mode, payload in app.astream(None, config, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            chunk, metadata = payload
+            if not isinstance(chunk, AIMessageChunk):
+                continue
+            node = metadata["langgraph_node"]
+            if chunk.id not in streamed:
+                print("time to first token ", node, ": ", round(time.perf_counter() - started, 3), "s")
+                streamed[chunk.id] = chunk
+            else:
+                streamed[chunk.id] = streamed[chunk.id] + chunk
+            current, previous = visible_text(streamed[chunk.id]), sent.get(chunk.id, "")
+            if current != previous:
+                sent[chunk.id] = current
+                if current.startswith(previous):
+                    yield {"event": "token", "id": chunk.id, "node": node, "delta": current[len(previous):]}
+                else:
+                    yield {"event": "token", "id": chunk.id, "node": node, "text": current}
+            continue
+
+        for node, value in payload.items():
+            if not isinstance(value, dict) or "messages" not in value:
+                continue
+            message = value["messages"][-1]
+            message.pretty_print()
+            if not isinstance(message, AIMessage):
+                continue
+            if message.content != "":
+                yield {"event": "message", "id": message.id, "node": node, "content": message.content}
+            elif message.tool_calls:
+                for tool_call in message.tool_calls:
+                    if tool_call["name"] == "ask_human":
+                        content = tool_call["args"]["question"]
+                        await app.aupdate_state(config, {"messages": [ToolMessage(content, tool_call_id=tool_call["id"])]})
+                        yield {"event": "message", "id": message.id, "node": node, "content": content}
@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
+from langchain_qdrant import QdrantVectorStore
+from langgraph.graph.state import CompiledStateGraph
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.models import Batch, Distance, VectorParams
+
+from catalog import catalog_version, iter_products
+from checkpointer import BoundedMemorySaver, SqliteCheckpointSaver
+from embedding_cache import CachedEmbeddings
+from hybrid_search import HybridIndex
+from index_snapshot import DEFAULT_INDEX_PATH, build_snapshot, load_snapshot
+from ingest import ingest_catalog, sync_catalog
+from intent_router import IntentRouter
+from numpy_store import NumpyVectorStore
+from search_cache import SemanticSearchCache
+from shop_graph import build_workflow
+from shop_search import ProductSearch
+
+# the shared client factory lives next to the samples in src/shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import llm_clients
+
+
+def create_models() -> Tuple[AzureChatOpenAI, AzureOpenAIEmbeddings]:
+    # both clients share the process-wide connection pools, so turns reuse kept-alive connections
+    llm = AzureChatOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
+        openai_api_version=os.getenv("AZURE_OPENAI_VERSION"),
+        temperature=0,
+        streaming=True,
+        http_client=llm_clients.http_client(),
+        max_retries=llm_clients.sdk_max_retries(),
+        http_async_client=llm_clients.async_http_client(),
+        **llm_clients.azure_openai_credentials(),
+    )
+    embeddings_model = AzureOpenAIEmbeddings(
+        azure_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+        openai_api_version = os.getenv("AZURE_OPENAI_VERSION"),
+        model= os.getenv("AZURE_OPENAI_EMBEDDING_MODEL"),
+        http_client=llm_clients.http_client(),
+        max_retries=llm_clients.sdk_max_retries(),
+        http_async_client=llm_clients.async_http_client(),
+        **llm_clients.azure_openai_credentials(),
+    )
+    return llm, embeddings_model
+
+
+# products copied from an index snapshot into Qdrant per upsert
+SEED_BATCH_SIZE = 1024
+
+
+def load_data(qdrant_client: QdrantClient, embeddings_model: CachedEmbeddings) -> str:
+    version = catalog_version('products.json')
+    if qdrant_client.count(collection_name="products").count > 0:
+        print("synced catalog: " + str(sync_catalog(qdrant_client, "products", embeddings_model, 'products.json')))
+        return version
+
+    snapshot = load_snapshot(os.getenv("PRODUCT_INDEX_PATH", DEFAULT_INDEX_PATH))
+    if snapshot is not None:
+        # Qdrant keeps its own copy of the vectors, it is seeded slice by slice so the mapped
+        # file is never held as Python lists in full; VECTOR_STORE=numpy searches the mapped file itself
+        for start in range(0, len(snapshot.ids), SEED_BATCH_SIZE):
+            end = start + SEED_BATCH_SIZE
+            qdrant_client.upsert(
+                collection_name="products",
+                points=Batch(ids=snapshot.ids[start:end], vectors=snapshot.vectors[start:end].tolist(), payloads=snapshot.payloads[start:end]),
+            )
+        print("seeded the index from a snapshot with " + str(len(snapshot.ids)) + " products, no embedding calls needed")
+        if snapshot.catalog_version != version:
+            # an outdated snapshot is only a head start, products changed since it was built are embedded now
+            print("index snapshot is older than products.json, synced: " + str(sync_catalog(qdrant_client, "products", embeddings_model, 'products.json')))
+        return version
+
+    stats = ingest_catalog(qdrant_client, "products", embeddings_model, 'products.json',
+                           on_progress=lambda progress: print("ingesting: " + str(progress)))
+    print("ingested " + str(stats) + ", embedding cache: ", embeddings_model.stats())
+    return version
+
+
+def init_numpy_store(embeddings_model: CachedEmbeddings) -> Tuple[NumpyVectorStore, str]:
+    path = os.getenv("PRODUCT_INDEX_PATH", DEFAULT_INDEX_PATH)
+    snapshot = load_snapshot(path)
+    # the numpy store serves the snapshot as it is, so an outdated one is rebuilt; unchanged
+    # products come from the embedding cache
+    if snapshot is None or snapshot.catalog_version != catalog_version('products.json'):
+        print("building the index snapshot, " + ("none found" if snapshot is None else "products.json changed since it was built"))
+        with llm_clients.llm_priority(llm_clients.BACKGROUND):
+            build_snapshot('products.json', embeddings_model, path)
+        snapshot = load_snapshot(path)
+    store = NumpyVectorStore.from_snapshot(snapshot, embeddings_model, os.getenv("VECTOR_QUANTIZATION", "float32"))
+    print("loaded " + str(len(store)) + " products into the numpy vector store, " + str(store.memory_bytes()) + " bytes in memory, "
+          + str(store.mapped_bytes()) + " bytes mapped from the snapshot")
+    return store, snapshot.catalog_version
+
+
+def init_product_search(embeddings_model: CachedEmbeddings) -> ProductSearch:
+    # VECTOR_STORE=numpy searches the memory-mapped snapshot directly instead of a Qdrant collection
+    if os.getenv("VECTOR_STORE", "qdrant") == "numpy":
+        vector_store, indexed_catalog_version = init_numpy_store(embeddings_model)
+        qdrant_client = None
+        async_qdrant_client = None
+    else:
+        # point QDRANT_URL at a Qdrant server to keep the index across restarts and sync it incrementally
+        qdrant_client = QdrantClient(url=os.getenv("QDRANT_URL")) if os.getenv("QDRANT_URL") else QdrantClient(":memory:")
+        if not qdrant_client.collection_exists("products"):
+            qdrant_client.create_collection(
+                collection_name="products",
+                vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
+            )
+
+        vector_store = QdrantVectorStore(
+            client=qdrant_client,
+            collection_name="products",
+            embedding=embeddings_model,
+        )
+
+        # embedding the catalog must not hold back the query embeddings of user turns
+        with llm_clients.llm_priority(llm_clients.BACKGROUND):
+            indexed_catalog_version = load_data(qdrant_client, embeddings_model)
+        # a Qdrant server also gets an async client, so the async graph awaits the vector search instead of blocking a thread
+        async_qdrant_client = AsyncQdrantClient(url=os.getenv("QDRANT_URL")) if os.getenv("QDRANT_URL") else None
+
+    # HYBRID_SEARCH=false falls back to pure vector similarity
+    hybrid_index = HybridIndex.from_products(iter_products('products.json')) if os.getenv("HYBRID_SEARCH", "true").lower() == "true" else None
+
+    return ProductSearch(
+        embeddings_model,
+        vector_store,
+        indexed_catalog_version,
+        SemanticSearchCache(),
+        hybrid_index,
+        qdrant_client=qdrant_client,
+        async_qdrant_client=async_qdrant_client,
+    )
+
+
+# CHECKPOINTER=sqlite keeps conversations on disk so they survive restarts
+def init_memory() -> Union[BoundedMemorySaver, SqliteCheckpointSaver]:
+    if os.getenv("CHECKPOINTER", "memory") == "sqlite":
+        return SqliteCheckpointSaver()
+    return BoundedMemorySaver()
+
+
+@contextmanager
+def timed(timings: Dict[str, float], phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = time.perf_counter() - started
+
+
+def startup_report(timings: Dict[str, float]) -> str:
+    phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items())
+    return f"startup: {phases}, total {sum(timings.values()):.2f}s"
+
+
+@dataclass
+class Shop:
+    llm: AzureChatOpenAI
+    embeddings_model: CachedEmbeddings
+    search: ProductSearch
+    intent_router: Optional[IntentRouter]
+    memory: Union[BoundedMemorySaver, SqliteCheckpointSaver]
+    app: CompiledStateGraph
+    # seconds spent in each startup phase
+    startup: Dict[str, float] = field(default_factory=dict)
+
+
+def build_shop() -> Shop:
+    """
+    Builds the LLM clients, the product index and the compiled graph. Meant to run once per
+    process, by the Streamlit app as well as by the headless server.
+    """
+    timings: Dict[str, float] = {}
+    with timed(timings, "models"):
+        llm, embeddings_model = create_models()
+        # reuse document vectors from the local embedding cache across restarts and
+        # query vectors across all sessions served by this process
+        embeddings_model = CachedEmbeddings(embeddings_model)
+    with timed(timings, "product_search"):
+        search = init_product_search(embeddings_model)
+    with timed(timings, "intent_router"):
+        # INTENT_ROUTER=false sends every user turn through the orchestrator LLM
+        intent_router = IntentRouter(embeddings_model) if os.getenv("INTENT_ROUTER", "true").lower() == "true" else None
+    with timed(timings, "checkpointer"):
+        memory = init_memory()
+    with timed(timings, "graph"):
+        app = build_workflow(llm, search, intent_router).compile(checkpointer=memory)
+    print(startup_report(timings))
+    return Shop(llm, embeddings_model, search, intent_router, memory, app, timings)
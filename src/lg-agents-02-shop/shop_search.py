@@ -0,0 +1,148 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.models import Filter, HasIdCondition
+
+from embedding_cache import CachedEmbeddings
+from hybrid_search import Filters, HybridIndex, matches, parse_measurements
+from numpy_store import NumpyVectorStore
+from search_cache import SemanticSearchCache, is_cacheable
+
+# without the hybrid index filters are applied to the vector results, so more of them are fetched
+FILTER_CANDIDATES = 4
+
+
+class ProductSearch:
+    """
+    Product search over the shop's vector store, fused with the hybrid BM25 index when there is
+    one and answered from the semantic search cache for near-duplicate queries.
+
+    Every search has a blocking and an async variant. The async variants await the query
+    embedding and, for a Qdrant server, the vector search, so they do not hold a thread while
+    waiting. In-memory stores are searched on a worker thread.
+    """
+
+    def __init__(
+        self,
+        embeddings: CachedEmbeddings,
+        vector_store: VectorStore,
+        catalog_version: str,
+        search_cache: SemanticSearchCache,
+        hybrid_index: Optional[HybridIndex] = None,
+        qdrant_client: Optional[QdrantClient] = None,
+        async_qdrant_client: Optional[AsyncQdrantClient] = None,
+        collection_name: str = "products",
+    ):
+        self.embeddings = embeddings
+        self.vector_store = vector_store
+        self.catalog_version = catalog_version
+        self.search_cache = search_cache
+        self.hybrid_index = hybrid_index
+        self.qdrant_client = qdrant_client
+        self.async_qdrant_client = async_qdrant_client
+        self.collection_name = collection_name
+
+    @property
+    def fused(self) -> bool:
+        """Whether search scores are reciprocal rank fusion scores rather than cosine similarities."""
+        return self.hybrid_index is not None
+
+    def _id_filter(self, allowed_ids: Optional[Set[str]]) -> Optional[Filter]:
+        if allowed_ids is None:
+            return None
+        return Filter(must=[HasIdCondition(has_id=list(allowed_ids))])
+
+    def vector_search(self, vector: List[float], allowed_ids: Optional[Set[str]], k: int) -> List[Tuple[Document, float]]:
+        if allowed_ids is None:
+            return self.vector_store.similarity_search_with_score_by_vector(vector, k=k)
+        if isinstance(self.vector_store, NumpyVectorStore):
+            return self.vector_store.similarity_search_with_score_by_vector(vector, k=k, filter=allowed_ids)
+        return self.vector_store.similarity_search_with_score_by_vector(vector, k=k, filter=self._id_filter(allowed_ids))
+
+    async def avector_search(self, vector: List[float], allowed_ids: Optional[Set[str]], k: int) -> List[Tuple[Document, float]]:
+        if self.async_qdrant_client is None:
+            return await asyncio.to_thread(self.vector_search, vector, allowed_ids, k)
+        response = await self.async_qdrant_client.query_points(
+            collection_name=self.collection_name,
+            query=vector,
+            query_filter=self._id_filter(allowed_ids),
+            limit=k,
+            with_payload=True,
+        )
+        return [
+            (Document(page_content=point.payload["page_content"], metadata=point.payload["metadata"]), point.score)
+            for point in response.points
+        ]
+
+    def _filter(self, results: List[Tuple[Document, float]], filters: Optional[Filters], k: int) -> List[Tuple[Document, float]]:
+        if not filters:
+            return results
+        return [(doc, score) for doc, score in results
+                if matches(parse_measurements(doc.metadata.get("measurements")), filters)][:k]
+
+    def get_product(self, id: str) -> Optional[Document]:
+        if self.hybrid_index is not None and id in self.hybrid_index.rows:
+            return self.hybrid_index.documents[self.hybrid_index.rows[id]]
+        if isinstance(self.vector_store, NumpyVectorStore):
+            return next(iter(self.vector_store.get_by_ids([id])), None)
+        points = self.qdrant_client.retrieve(collection_name=self.collection_name, ids=[id], with_payload=True)
+        if not points:
+            return None
+        return Document(page_content=points[0].payload["page_content"], metadata=points[0].payload["metadata"])
+
+    async def aget_product(self, id: str) -> Optional[Document]:
+        if self.async_qdrant_client is None or (self.hybrid_index is not None and id in self.hybrid_index.rows):
+            return await asyncio.to_thread(self.get_product, id)
+        points = await self.async_qdrant_client.retrieve(collection_name=self.collection_name, ids=[id], with_payload=True)
+        if not points:
+            return None
+        return Document(page_content=points[0].payload["page_content"], metadata=points[0].payload["metadata"])
+
+    def search(self, query: str, k: int = 5, filters: Optional[Filters] = None, vector: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        vector = vector or self.embeddings.embed_query(query)
+        # filtered searches and queries with numbers are not cached, the cache only knows about query similarity
+        cacheable = is_cacheable(query, filters)
+        results = self.search_cache.lookup(vector, k, self.catalog_version) if cacheable else None
+        if results is None:
+            if self.hybrid_index is not None:
+                results = self.hybrid_index.search(
+                    query, lambda allowed_ids, candidates: self.vector_search(vector, allowed_ids, candidates), k, filters
+                )
+            else:
+                results = self._filter(self.vector_search(vector, None, k * FILTER_CANDIDATES if filters else k), filters, k)
+            if cacheable:
+                self.search_cache.store(vector, k, results, self.catalog_version)
+        return results
+
+    async def asearch(self, query: str, k: int = 5, filters: Optional[Filters] = None, vector: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        vector = vector or await self.embeddings.aembed_query(query)
+        cacheable = is_cacheable(query, filters)
+        results = self.search_cache.lookup(vector, k, self.catalog_version) if cacheable else None
+        if results is None:
+            if self.hybrid_index is not None:
+                results = await self.hybrid_index.asearch(
+                    query, lambda allowed_ids, candidates: self.avector_search(vector, allowed_ids, candidates), k, filters
+                )
+            else:
+                results = self._filter(await self.avector_search(vector, None, k * FILTER_CANDIDATES if filters else k), filters, k)
+            if cacheable:
+                self.search_cache.store(vector, k, results, self.catalog_version)
+        return results
+
+    def search_batch(self, queries: List[str], k: int = 5) -> List[List[Tuple[Document, float]]]:
+        if not queries:
+            return []
+        # one embedding request for all queries, then the searches run side by side
+        vectors = self.embeddings.embed_queries(queries)
+        with ThreadPoolExecutor(max_workers=min(8, len(queries))) as executor:
+            return list(executor.map(lambda query, vector: self.search(query, k, vector=vector), queries, vectors))
+
+    async def asearch_batch(self, queries: List[str], k: int = 5) -> List[List[Tuple[Document, float]]]:
+        if not queries:
+            return []
+        vectors = await self.embeddings.aembed_queries(queries)
+        return list(await asyncio.gather(*(self.asearch(query, k, vector=vector) for query, vector in zip(queries, vectors))))
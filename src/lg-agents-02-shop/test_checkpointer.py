@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langchain_core.messages import AIMessage
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+import checkpointer
+from checkpointer import BoundedMemorySaver
+
+
+def compile_graph(saver):
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("answer", lambda state: {"messages": [AIMessage(content="x" * 100)]})
+    workflow.add_edge(START, "answer")
+    workflow.add_edge("answer", END)
+    return workflow.compile(checkpointer=saver)
+
+
+def turn(app, thread_id):
+    app.invoke({"messages": [("user", "hello")]}, {"configurable": {"thread_id": thread_id}})
+
+
+def has_thread(saver, thread_id):
+    return saver.get_tuple({"configurable": {"thread_id": thread_id}}) is not None
+
+
+def test_least_recently_used_thread_is_evicted():
+    saver = BoundedMemorySaver(max_threads=2, active=0)
+    app = compile_graph(saver)
+    turn(app, "a")
+    turn(app, "b")
+    # reading a thread counts as using it
+    assert has_thread(saver, "a")
+    turn(app, "c")
+    assert [has_thread(saver, id) for id in "abc"] == [True, False, True]
+    assert saver.stats()["live_threads"] == 2
+    assert saver.stats()["evictions"] == 1
+
+
+def test_idle_threads_expire(monkeypatch):
+    saver = BoundedMemorySaver(ttl=60)
+    app = compile_graph(saver)
+    now = 1000.0
+    monkeypatch.setattr(checkpointer.time, "time", lambda: now)
+    turn(app, "a")
+    now += 120
+    turn(app, "b")
+    assert not has_thread(saver, "a")
+    assert has_thread(saver, "b")
+
+
+def test_byte_budget_keeps_the_thread_being_written():
+    saver = BoundedMemorySaver(max_bytes=1, active=0)
+    app = compile_graph(saver)
+    turn(app, "a")
+    turn(app, "b")
+    assert not has_thread(saver, "a")
+    assert has_thread(saver, "b")
+    assert saver.stats()["checkpoint_bytes"] > 1
+
+
+def test_recently_written_threads_are_kept_over_the_bounds(monkeypatch):
+    saver = BoundedMemorySaver(max_threads=1, active=60)
+    app = compile_graph(saver)
+    now = 1000.0
+    monkeypatch.setattr(checkpointer.time, "time", lambda: now)
+    turn(app, "a")
+    turn(app, "b")
+    # "a" may be between two steps of a run
+    assert has_thread(saver, "a")
+    now += 120
+    turn(app, "c")
+    assert [has_thread(saver, id) for id in "abc"] == [False, False, True]
+
+
+def test_unknown_threads_are_not_stored():
+    saver = BoundedMemorySaver()
+    assert not has_thread(saver, "a")
+    assert list(saver.list({"configurable": {"thread_id": "a"}})) == []
+    assert "a" not in saver.storage
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from benchmark_load import DIMENSION, FakeEmbeddings
+from embedding_cache import CachedEmbeddings
+
+
+def test_zero_query_cache_size_keeps_nothing_in_memory(tmp_path):
+    embeddings = CachedEmbeddings(FakeEmbeddings(0.0), os.path.join(tmp_path, "embeddings.db"), DIMENSION,
+                                  query_cache_size=0, persist_queries=True)
+    first = embeddings.embed_query("oak table")
+    # the persisted vector, stored as float32, is still found, it just isn't kept in memory
+    assert embeddings.embed_query("oak table") == pytest.approx(first, rel=1e-6)
+    assert embeddings.stats()["cached_queries"] == 0
+    assert embeddings.query_hits == 1
+
+
+def test_zero_query_cache_ttl_expires_every_query(tmp_path):
+    embeddings = CachedEmbeddings(FakeEmbeddings(0.0), os.path.join(tmp_path, "embeddings.db"), DIMENSION, query_cache_ttl=0)
+    assert embeddings.query_cache_ttl == 0
+    embeddings.embed_query("oak table")
+    embeddings.embed_query("oak table")
+    assert embeddings.query_misses == 2
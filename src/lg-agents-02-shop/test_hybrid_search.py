@@ -0,0 +1,47 @@
+import pytest
+from langchain_core.documents import Document
+
+from hybrid_search import HybridIndex, parse_filters, parse_measurements
+
+
+def product(id, title, measurements="", description=""):
+    return Document(page_content=description, metadata={"id": id, "title": title, "measurements": measurements})
+
+
+def test_parse_filters_converts_units_and_merges_bounds():
+    assert parse_filters("width <= 90, length >= 2 m") == {"width": (None, 90.0), "length": (200.0, None)}
+    assert parse_filters("Seat height > 400 mm, seat height < 50") == {"seat_height": (40.0, 50.0)}
+    assert parse_filters("width = 80,5") == {"width": (80.5, 80.5)}
+    assert parse_filters("a comfortable sofa") == {}
+    assert parse_filters(None) == {}
+
+
+def test_parse_measurements():
+    assert parse_measurements("Length:  140 cm Width:  80 cm Height: 1,2 m") == {"length": 140.0, "width": 80.0, "height": 120.0}
+
+
+def test_fuse_ranks_documents_found_by_both_searches_first():
+    index = HybridIndex(rrf_k=60)
+    a, b, c = product("a", "A"), product("b", "B"), product("c", "C")
+    fused = index.fuse([a, b], [c, b], k=3)
+    assert [doc.metadata["id"] for doc, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 62)
+    assert fused[1][1] == pytest.approx(1 / 61)
+    assert len(index.fuse([a, b], [c, b], k=1)) == 1
+
+
+def test_search_applies_the_filters_to_both_sides():
+    index = HybridIndex()
+    index.add(product("narrow", "oak wardrobe", "Width: 80 cm"))
+    index.add(product("wide", "oak wardrobe", "Width: 120 cm"))
+    index.add(product("unknown", "oak wardrobe"))
+    seen = []
+
+    def vector_search(allowed_ids, candidates):
+        seen.append(allowed_ids)
+        return [(doc, 1.0) for doc in index.documents if allowed_ids is None or doc.metadata["id"] in allowed_ids]
+
+    results = index.search("oak wardrobe", vector_search, k=5, filters=parse_filters("width <= 90"))
+    assert [doc.metadata["id"] for doc, _ in results] == ["narrow"]
+    assert seen == [{"narrow"}]
+    assert index.search("oak wardrobe", vector_search, filters=parse_filters("width >= 500")) == []
@@ -0,0 +1,44 @@
+from langchain_core.documents import Document
+
+from search_cache import SemanticSearchCache, is_cacheable
+
+RESULTS = [(Document(page_content="bed frame"), 0.9), (Document(page_content="mattress"), 0.8)]
+
+
+def test_similar_queries_hit_and_a_new_catalog_version_clears_the_cache():
+    cache = SemanticSearchCache(threshold=0.97, max_entries=4)
+    cache.store([1.0, 0.0], 2, RESULTS, "v1")
+    assert cache.lookup([1.0, 0.01], 2, "v1") == RESULTS
+    assert cache.lookup([1.0, 0.01], 2, "v2") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "invalidations": 1, "entries": 0}
+
+
+def test_dissimilar_queries_and_larger_k_miss():
+    cache = SemanticSearchCache(threshold=0.97, max_entries=4)
+    cache.store([1.0, 0.0], 2, RESULTS, "v1")
+    assert cache.lookup([0.0, 1.0], 2, "v1") is None
+    assert cache.lookup([1.0, 0.0], 3, "v1") is None
+    assert cache.lookup([1.0, 0.0], 1, "v1") == RESULTS[:1]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticSearchCache(threshold=0.97, max_entries=2)
+    cache.store([1.0, 0.0, 0.0], 1, RESULTS[:1], "v1")
+    cache.store([0.0, 1.0, 0.0], 1, RESULTS[1:], "v1")
+    cache.lookup([1.0, 0.0, 0.0], 1, "v1")
+    cache.store([0.0, 0.0, 1.0], 1, RESULTS[:1], "v1")
+    assert cache.lookup([0.0, 1.0, 0.0], 1, "v1") is None
+    assert cache.lookup([1.0, 0.0, 0.0], 1, "v1") == RESULTS[:1]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_zero_entries_disables_the_cache():
+    cache = SemanticSearchCache(threshold=0.97, max_entries=0)
+    cache.store([1.0, 0.0], 2, RESULTS, "v1")
+    assert cache.lookup([1.0, 0.0], 2, "v1") is None
+
+
+def test_queries_with_numbers_or_filters_are_not_cached():
+    assert is_cacheable("king size bed frame")
+    assert not is_cacheable("red shoes size 42")
+    assert not is_cacheable("wardrobe", {"width": (None, 90.0)})
@@ -0,0 +1,26 @@
+import time
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from fastapi.testclient import TestClient
+
+import server
+
+
+def test_health_reports_a_failed_startup(monkeypatch):
+    def build_shop():
+        raise RuntimeError("Qdrant is unreachable")
+
+    monkeypatch.setattr(server, "build_shop", build_shop)
+    monkeypatch.setattr(server, "startup_error", None)
+    with TestClient(server.api) as client:
+        for _ in range(100):
+            response = client.get("/health")
+            if response.status_code != 503:
+                break
+            time.sleep(0.01)
+        assert response.status_code == 500
+        assert response.json() == {"status": "failed", "error": "RuntimeError: Qdrant is unreachable"}
+        assert client.post("/warmup").status_code == 500
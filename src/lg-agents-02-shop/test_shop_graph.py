@@ -0,0 +1,64 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("langgraph")
+
+from benchmark_load import DIMENSION, FakeChatModel, FakeEmbeddings
+from embedding_cache import CachedEmbeddings
+from hybrid_search import HybridIndex, parse_filters
+from numpy_store import NumpyVectorStore
+from search_cache import SemanticSearchCache
+from shop_graph import adaptive_cutoff, build_workflow
+from shop_search import ProductSearch
+
+
+def product_search(tmp_path, hybrid):
+    embeddings = CachedEmbeddings(FakeEmbeddings(0.0), os.path.join(tmp_path, "embeddings.db"), DIMENSION)
+    store = NumpyVectorStore(embeddings, DIMENSION)
+    ids = [f"table-{index}" for index in range(5)]
+    # only the first product matches "oak table" by keyword, the vector search finds all of them
+    titles = ["Oak table", "Pine bench", "Pine chair", "Pine stool", "Pine shelf"]
+    payloads = [{
+        "page_content": f"Solid wood, seats {index + 2}",
+        "metadata": {"id": id, "title": titles[index], "measurements": f"Width: {80 + 10 * index} cm", "summary": titles[index]},
+    } for index, id in enumerate(ids)]
+    store.add_vectors(ids, np.random.default_rng(7).normal(size=(len(ids), DIMENSION)), payloads)
+    hybrid_index = None
+    if hybrid:
+        hybrid_index = HybridIndex()
+        for doc in store.get_by_ids(ids):
+            hybrid_index.add(doc)
+    return ProductSearch(embeddings, store, "test", SemanticSearchCache(max_entries=0), hybrid_index)
+
+
+def search_tool(tmp_path, hybrid):
+    workflow = build_workflow(FakeChatModel(latency=0.0), product_search(tmp_path, hybrid))
+    return workflow.nodes["search_tools"].runnable.tools_by_name["product_search_tool"]
+
+
+def test_hybrid_results_are_not_cut_to_the_first_product(tmp_path):
+    results = search_tool(tmp_path, hybrid=True).invoke({"query": "oak table"})
+    assert results[0].id == "table-0"
+    assert len(results) == 5
+
+
+def test_hybrid_search_tool_applies_the_measurement_filter(tmp_path):
+    results = search_tool(tmp_path, hybrid=True).invoke({"query": "oak table", "measurement_filter": "width <= 95 cm"})
+    assert sorted(result.id for result in results) == ["table-0", "table-1"]
+
+
+def test_vector_search_applies_the_measurement_filter(tmp_path):
+    search = product_search(tmp_path, hybrid=False)
+    filters = parse_filters("width >= 95 cm")
+    wide = ["table-2", "table-3", "table-4"]
+    assert sorted(doc.metadata["id"] for doc, _ in search.search("oak table", filters=filters)) == wide
+    assert sorted(doc.metadata["id"] for doc, _ in asyncio.run(search.asearch("oak table", filters=filters))) == wide
+
+
+def test_cosine_scores_stop_at_the_first_large_drop():
+    results = [("a", 0.9), ("b", 0.85), ("c", 0.4), ("d", 0.38)]
+    assert adaptive_cutoff(results) == results[:2]
+    assert adaptive_cutoff(results, fused=True) == results
@@ -20,6 +20,10 @@ from llama_index.core.memory import ChatMemoryBuffer
 from llama_index.core.tools.types import BaseTool
 from llama_index.core.workflow import Workflow, StartEvent, StopEvent, step
 
+# the shared client factory lives next to the samples in src/shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import llm_clients
+
 dotenv.load_dotenv()
 
 logging.basicConfig(
@@ -35,10 +39,13 @@ if "AZURE_OPENAI_API_KEY" in os.environ:
         azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_version=os.getenv("OPENAI_API_VERSION")
+        api_version=os.getenv("OPENAI_API_VERSION"),
+        http_client=llm_clients.http_client(),
+        max_retries=llm_clients.sdk_max_retries(),
+        async_http_client=llm_clients.async_http_client(),
     )
 else:
-    token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
+    token_provider = llm_clients.token_provider()
     azureOpenAI = AzureOpenAI(
         azure_ad_token_provider=token_provider,
         use_azure_ad=True,
@@ -46,7 +53,10 @@ else:
         azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
         api_key=token_provider(),
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_version=os.getenv("OPENAI_API_VERSION")
+        api_version=os.getenv("OPENAI_API_VERSION"),
+        http_client=llm_clients.http_client(),
+        max_retries=llm_clients.sdk_max_retries(),
+        async_http_client=llm_clients.async_http_client(),
     )
 
 # handle events
@@ -0,0 +1,217 @@
+"""
+Process-wide HTTP clients for the Azure OpenAI clients of all samples.
+
+Every framework (LangChain, Semantic Kernel, LlamaIndex, AutoGen) ends up in the OpenAI SDK,
+which opens its own connection pool per client object unless it is handed one. The clients
+here are created once per process and shared, so connections to the Azure OpenAI endpoint are
+kept alive between agent turns instead of paying a TLS handshake on every new client.
+"""
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from openai import AsyncAzureOpenAI, AzureOpenAI
+
+from .rate_limiter import BACKGROUND, INTERACTIVE, PRIORITY_HEADER, limiter, llm_priority  # noqa: F401
+
+try:
+    import h2  # noqa: F401 - httpx only speaks HTTP/2 with the h2 package installed
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# reentrant, the OpenAI SDK clients create the HTTP clients they wrap while it is held
+_lock = threading.RLock()
+_clients: Dict[str, Any] = {}
+
+
+def pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60")),
+    )
+
+
+def pool_timeout() -> httpx.Timeout:
+    # LLM responses can take a while, connecting should not
+    return httpx.Timeout(
+        float(os.getenv("LLM_HTTP_TIMEOUT", "120")),
+        connect=float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10")),
+    )
+
+
+def http2_enabled() -> bool:
+    return HTTP2_AVAILABLE and os.getenv("LLM_HTTP2", "true").lower() == "true"
+
+
+class PoolMetrics:
+    """
+    Counts requests and newly opened connections of a pool, every request that did not open a
+    connection reused a kept-alive one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def count_event(self, event_name: str) -> None:
+        # httpcore trace events, emitted while a new connection is set up
+        with self._lock:
+            if event_name == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            elif event_name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+
+    def stats(self, pool: Any) -> Dict[str, Any]:
+        connections = list(getattr(pool, "connections", []))
+        with self._lock:
+            reused = max(self.requests - self.connections_opened, 0)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                "reuse_ratio": reused / self.requests if self.requests else 0.0,
+                "open_connections": len(connections),
+                "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+                "http2_connections": sum(1 for connection in connections if "HTTP/2" in connection.info()),
+            }
+
+
+class PooledTransport(httpx.HTTPTransport):
+    def __init__(self, **kwargs: Any):
+        super().__init__(http2=http2_enabled(), limits=pool_limits(), **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _send(self, request: httpx.Request) -> httpx.Response:
+        self.metrics.count_request()
+        return super().handle_request(request)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        outer_trace = request.extensions.get("trace")
+
+        def trace(event_name: str, info: Dict[str, Any]) -> None:
+            self.metrics.count_event(event_name)
+            if outer_trace is not None:
+                outer_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        # every request waits for its deployment's rate limits, see rate_limiter.py
+        return limiter().send(request, self._send)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.metrics.stats(self._pool)
+
+
+class AsyncPooledTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, **kwargs: Any):
+        super().__init__(http2=http2_enabled(), limits=pool_limits(), **kwargs)
+        self.metrics = PoolMetrics()
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        self.metrics.count_request()
+        return await super().handle_async_request(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        outer_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            self.metrics.count_event(event_name)
+            if outer_trace is not None:
+                await outer_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        return await limiter().asend(request, self._send)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.metrics.stats(self._pool)
+
+
+def _shared(name: str, create: Callable[[], Any]) -> Any:
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = create()
+    return client
+
+
+def http_client() -> httpx.Client:
+    """
+    The pooled client for synchronous calls, pass it as `http_client` to LangChain, LlamaIndex
+    or the OpenAI SDK.
+    """
+    return _shared("http", lambda: httpx.Client(transport=PooledTransport(), timeout=pool_timeout()))
+
+
+def async_http_client() -> httpx.AsyncClient:
+    """
+    The pooled client for async calls, pass it as `http_async_client` to LangChain,
+    `async_http_client` to LlamaIndex or `http_client` to AutoGen. Its connections belong to
+    the event loop that opened them, so use it from one long running loop per process.
+    """
+    return _shared("async_http", lambda: httpx.AsyncClient(transport=AsyncPooledTransport(), timeout=pool_timeout()))
+
+
+def token_provider() -> Callable[[], str]:
+    # one credential per process, so its token cache is shared as well
+    return _shared("token_provider", lambda: get_bearer_token_provider(
+        DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"))
+
+
+def azure_openai_credentials() -> Dict[str, Any]:
+    # an API key when one is configured, Entra ID otherwise
+    if "AZURE_OPENAI_API_KEY" in os.environ:
+        return {"api_key": os.getenv("AZURE_OPENAI_API_KEY")}
+    return {"azure_ad_token_provider": token_provider()}
+
+
+def sdk_max_retries() -> int:
+    """
+    The retries to configure on SDK clients that send through the shared pools. The rate limiter
+    already retries 429s, 5xx answers, connection errors and timeouts, retries in the SDK on top
+    of it would multiply them.
+    """
+    return 0 if limiter().enabled else 2
+
+
+def azure_openai_client() -> AzureOpenAI:
+    return _shared("azure_openai", lambda: AzureOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_version=os.getenv("AZURE_OPENAI_VERSION"),
+        http_client=http_client(),
+        max_retries=sdk_max_retries(),
+        **azure_openai_credentials(),
+    ))
+
+
+def async_azure_openai_client() -> AsyncAzureOpenAI:
+    """
+    The async OpenAI SDK client on the shared pool, pass it as `async_client` to Semantic Kernel.
+    """
+    return _shared("async_azure_openai", lambda: AsyncAzureOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_version=os.getenv("AZURE_OPENAI_VERSION"),
+        http_client=async_http_client(),
+        max_retries=sdk_max_retries(),
+        **azure_openai_credentials(),
+    ))
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    stats = {}
+    for name in ("http", "async_http"):
+        client: Optional[httpx.Client] = _clients.get(name)
+        if client is not None:
+            stats[name] = client._transport.stats()
+    return stats
+
@@ -0,0 +1,378 @@
+"""
+Process-wide scheduler for Azure OpenAI requests.
+
+Every request waits for its deployment's token buckets (requests and tokens per minute) before
+it is sent, in priority order, so concurrent agents stay below the deployment quota instead of
+collecting 429s and retrying blindly. A 429 pauses the whole deployment for the `retry-after`
+the service asked for and the request is queued again. Server errors, connection errors and
+timeouts are retried with backoff. The `x-ratelimit-remaining-*` headers of every response keep
+the buckets in line with what the service actually counts.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+# lower runs first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+PRIORITY_HEADER = "x-llm-priority"
+# server errors are retried with backoff, without pausing the deployment
+RETRY_STATUS = {500, 502, 503, 504}
+DEPLOYMENT_PATH = re.compile(r"/openai/deployments/([^/]+)/")
+# async waiters cannot be woken by the condition, they look again after this many seconds
+ASYNC_POLL_SECONDS = 0.05
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: int) -> Iterator[None]:
+    """
+    Runs the LLM calls made inside the block, including tasks and threads started from it,
+    with the given priority.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(request: httpx.Request) -> int:
+    """
+    What the service will count against the tokens per minute: about four characters per prompt
+    token plus the completion tokens the request allows.
+    """
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return 1
+    if not isinstance(body, dict):
+        return 1
+    characters = 0
+    for message in body.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(str(part.get("text", "")) for part in content if isinstance(part, dict))
+        characters += len(str(content or "")) + len(json.dumps(message.get("tool_calls") or ""))
+    if body.get("tools"):
+        characters += len(json.dumps(body["tools"]))
+    inputs = body.get("input")
+    if isinstance(inputs, str):
+        characters += len(inputs)
+    elif isinstance(inputs, list):
+        for item in inputs:
+            # embeddings of pre-tokenized input arrive as lists of token ids
+            characters += len(item) * 4 if isinstance(item, list) else len(str(item))
+    completion = body.get("max_tokens") or body.get("max_completion_tokens")
+    if completion is None and "messages" in body:
+        completion = int(os.getenv("LLM_RATE_COMPLETION_TOKENS", "500"))
+    return max(1, characters // 4 + int(completion or 0))
+
+
+def backoff_seconds(attempt: int) -> float:
+    return min(2 ** attempt, 30)
+
+
+def retry_after_seconds(response: httpx.Response, attempt: int) -> float:
+    headers = response.headers
+    if "retry-after-ms" in headers:
+        return float(headers["retry-after-ms"]) / 1000
+    try:
+        return float(headers["retry-after"])
+    except (KeyError, ValueError):
+        return backoff_seconds(attempt)
+
+
+class TokenBucket:
+    # `per_minute` 0 means unlimited
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: int, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        # a request larger than the bucket goes through once the bucket is full
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount: int) -> None:
+        if self.capacity:
+            self.level -= amount
+
+    def limit_to(self, remaining: float) -> None:
+        if self.capacity:
+            self.level = min(self.level, remaining)
+
+
+class DeploymentQueue:
+    """
+    Waiting requests of one deployment, ordered by priority and then arrival. Only the head of
+    the queue may take from the buckets, so a large request is not starved by small ones.
+    """
+
+    def __init__(self, name: str, tokens_per_minute: int, requests_per_minute: int):
+        self.name = name
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.requests = TokenBucket(requests_per_minute)
+        self.blocked_until = 0.0
+        self.condition = threading.Condition()
+        self.waiting: List[Tuple[int, int]] = []
+        self.sent = 0
+        self.throttled = 0
+        self.waits: Dict[int, List[float]] = {}
+
+    def _grant(self, ticket: Tuple[int, int], cost: int) -> Optional[float]:
+        # called with the condition held, None means another request is first
+        if self.waiting[0] != ticket:
+            return None
+        now = time.monotonic()
+        delay = max(self.blocked_until - now, self.tokens.delay(cost, now), self.requests.delay(1, now))
+        if delay <= 0:
+            heapq.heappop(self.waiting)
+            self.tokens.take(cost)
+            self.requests.take(1)
+            self.sent += 1
+            self.condition.notify_all()
+        return delay
+
+    def _abandon(self, ticket: Tuple[int, int]) -> None:
+        with self.condition:
+            if ticket in self.waiting:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+
+    def _record_wait(self, priority: int, seconds: float) -> None:
+        with self.condition:
+            waits = self.waits.setdefault(priority, [0, 0.0, 0.0])
+            waits[0] += 1
+            waits[1] += seconds
+            waits[2] = max(waits[2], seconds)
+        if seconds >= 1:
+            print("rate limiter: waited ", round(seconds, 2), "s for ", self.name, " at priority ", priority)
+
+    def acquire(self, ticket: Tuple[int, int], cost: int) -> None:
+        started = time.monotonic()
+        try:
+            with self.condition:
+                heapq.heappush(self.waiting, ticket)
+                while True:
+                    delay = self._grant(ticket, cost)
+                    if delay is not None and delay <= 0:
+                        break
+                    self.condition.wait(delay if delay is not None else 1.0)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self._record_wait(ticket[0], time.monotonic() - started)
+
+    async def aacquire(self, ticket: Tuple[int, int], cost: int) -> None:
+        started = time.monotonic()
+        try:
+            with self.condition:
+                heapq.heappush(self.waiting, ticket)
+            while True:
+                with self.condition:
+                    delay = self._grant(ticket, cost)
+                if delay is not None and delay <= 0:
+                    break
+                await asyncio.sleep(min(delay, ASYNC_POLL_SECONDS) if delay is not None else ASYNC_POLL_SECONDS)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self._record_wait(ticket[0], time.monotonic() - started)
+
+    def observe(self, response: httpx.Response, attempt: int) -> Optional[float]:
+        """
+        Updates the buckets from the response headers, returns how long to back off after a 429.
+        """
+        with self.condition:
+            if "x-ratelimit-remaining-tokens" in response.headers:
+                self.tokens.limit_to(float(response.headers["x-ratelimit-remaining-tokens"]))
+            if "x-ratelimit-remaining-requests" in response.headers:
+                self.requests.limit_to(float(response.headers["x-ratelimit-remaining-requests"]))
+            if response.status_code != 429:
+                return None
+            self.throttled += 1
+            seconds = retry_after_seconds(response, attempt)
+            # everyone waiting for this deployment backs off, not only the request that was refused
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+            return seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                "sent": self.sent,
+                "throttled": self.throttled,
+                "queued": len(self.waiting),
+                "wait_seconds": {
+                    priority: {"requests": count, "average": total / count, "max": longest}
+                    for priority, (count, total, longest) in sorted(self.waits.items())
+                },
+            }
+
+
+def parse_limits(value: str) -> Dict[str, Tuple[int, int]]:
+    # "gpt-4o=30000/180,text-embedding-ada-002=120000/720" in tokens/requests per minute
+    limits = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        name, _, limit = entry.partition("=")
+        tokens, _, requests = limit.partition("/")
+        limits[name.strip()] = (int(tokens or 0), int(requests or 0))
+    return limits
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        tokens_per_minute: int = 0,
+        requests_per_minute: int = 0,
+        limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        max_retries: int = 3,
+        max_retry_after: float = 60.0,
+        enabled: bool = True,
+    ):
+        self.default_limits = (tokens_per_minute, requests_per_minute)
+        self.limits = limits or {}
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.enabled = enabled
+        self._queues: Dict[str, DeploymentQueue] = {}
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+
+    @classmethod
+    def from_environment(cls) -> "RateLimiter":
+        return cls(
+            tokens_per_minute=int(os.getenv("LLM_RATE_LIMIT_TPM", "0")),
+            requests_per_minute=int(os.getenv("LLM_RATE_LIMIT_RPM", "0")),
+            limits=parse_limits(os.getenv("LLM_RATE_LIMITS", "")),
+            max_retries=int(os.getenv("LLM_RATE_MAX_RETRIES", "3")),
+            max_retry_after=float(os.getenv("LLM_RATE_MAX_RETRY_AFTER", "60")),
+            enabled=os.getenv("LLM_RATE_LIMITER", "true").lower() == "true",
+        )
+
+    def queue(self, request: httpx.Request) -> DeploymentQueue:
+        match = DEPLOYMENT_PATH.search(request.url.path)
+        name = match.group(1) if match else request.url.host
+        with self._lock:
+            if name not in self._queues:
+                self._queues[name] = DeploymentQueue(name, *self.limits.get(name, self.default_limits))
+            return self._queues[name]
+
+    def _ticket(self, request: httpx.Request) -> Tuple[int, int]:
+        priority = request.headers.get(PRIORITY_HEADER)
+        if priority is not None:
+            # only meant for this scheduler, not for the service
+            del request.headers[PRIORITY_HEADER]
+        return (int(priority) if priority is not None else _priority.get(), next(self._order))
+
+    def _retry(self, queue: DeploymentQueue, response: httpx.Response, attempt: int) -> Optional[float]:
+        """
+        None if the response is final, otherwise how long this request sleeps before it queues again.
+        """
+        seconds = queue.observe(response, attempt)
+        if seconds is None and response.status_code in RETRY_STATUS:
+            seconds = retry_after_seconds(response, attempt)
+        if seconds is None or attempt >= self.max_retries or seconds > self.max_retry_after:
+            return None
+        print("rate limiter: ", queue.name, " answered ", response.status_code, ", retrying in ", round(seconds, 2), "s")
+        # the 429 pause is waited for in the queue, a server error only delays this request
+        return 0.0 if response.status_code == 429 else seconds
+
+    def _retry_error(self, queue: DeploymentQueue, error: httpx.TransportError, attempt: int) -> Optional[float]:
+        """
+        None if the request fails with `error`, otherwise how long it sleeps before it queues again.
+        Connection errors and timeouts are retried like server errors, for example when the
+        service closed a pooled keep-alive connection.
+        """
+        if attempt >= self.max_retries:
+            return None
+        seconds = backoff_seconds(attempt)
+        print("rate limiter: ", queue.name, " failed with ", type(error).__name__, ", retrying in ", seconds, "s")
+        return seconds
+
+    def send(self, request: httpx.Request, send: Callable[[httpx.Request], httpx.Response]) -> httpx.Response:
+        if not self.enabled:
+            return send(request)
+        queue, cost = self.queue(request), estimate_tokens(request)
+        ticket = self._ticket(request)
+        for attempt in itertools.count():
+            # a retried request keeps its place in the queue
+            queue.acquire(ticket, cost)
+            try:
+                response = send(request)
+            except httpx.TransportError as error:
+                backoff = self._retry_error(queue, error, attempt)
+                if backoff is None:
+                    raise
+                time.sleep(backoff)
+                continue
+            backoff = self._retry(queue, response, attempt)
+            if backoff is None:
+                return response
+            # read the refusal, so its connection goes back to the pool
+            response.read()
+            response.close()
+            time.sleep(backoff)
+
+    async def asend(self, request: httpx.Request, send: Callable[[httpx.Request], Awaitable[httpx.Response]]) -> httpx.Response:
+        if not self.enabled:
+            return await send(request)
+        queue, cost = self.queue(request), estimate_tokens(request)
+        ticket = self._ticket(request)
+        for attempt in itertools.count():
+            await queue.aacquire(ticket, cost)
+            try:
+                response = await send(request)
+            except httpx.TransportError as error:
+                backoff = self._retry_error(queue, error, attempt)
+                if backoff is None:
+                    raise
+                await asyncio.sleep(backoff)
+                continue
+            backoff = self._retry(queue, response, attempt)
+            if backoff is None:
+                return response
+            await response.aread()
+            await response.aclose()
+            await asyncio.sleep(backoff)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            queues = list(self._queues.values())
+        return {queue.name: queue.stats() for queue in queues}
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def limiter() -> RateLimiter:
+    # created on first use, after the samples loaded their .env file
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter.from_environment()
+        return _limiter
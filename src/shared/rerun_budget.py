@@ -0,0 +1,79 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, local_script_runner
+
+# placeholders for --offline runs, the clients are only constructed and never called
+OFFLINE_ENVIRONMENT = {
+    "AZURE_OPENAI_API_KEY": "offline",
+    "AZURE_OPENAI_ENDPOINT": "https://offline.openai.azure.com/",
+    "AZURE_OPENAI_VERSION": "2024-02-01",
+    "AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME": "offline",
+    "AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME": "offline",
+    "AZURE_OPENAI_EMBEDDING_MODEL": "text-embedding-ada-002",
+    "APPLICATIONINSIGHTS_CONNECTION_STRING": "InstrumentationKey=00000000-0000-0000-0000-000000000000",
+}
+
+
+def use_offline_shop() -> None:
+    # the shop index needs the embedding deployment, build it from the fakes of the shop's benchmark_load.py instead
+    import benchmark_load
+    import shop_resources
+
+    def build_offline_shop() -> shop_resources.Shop:
+        timings = {}
+        with shop_resources.timed(timings, "graph"):
+            app = benchmark_load.build_app(tempfile.mkdtemp(), 200, 0.0, 0.0)
+        return shop_resources.Shop(None, None, None, None, None, app, timings)
+
+    shop_resources.build_shop = build_offline_shop
+
+
+def share_script_cache() -> None:
+    # AppTest compiles the script again on every run, the server compiles it once per process
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+
+
+def run(app_test: AppTest) -> float:
+    started = time.perf_counter()
+    app_test.run()
+    seconds = time.perf_counter() - started
+    if app_test.exception:
+        raise RuntimeError(app_test.exception[0].message)
+    return seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail when a Streamlit rerun of an app takes longer than the budget")
+    parser.add_argument("app", help="path to the Streamlit script, e.g. ../lg-agents-02-shop/app.py")
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("RERUN_BUDGET_MS", "100")), help="median rerun time")
+    parser.add_argument("--offline", action="store_true", help="run without Azure OpenAI, clients get placeholder settings")
+    args = parser.parse_args()
+
+    app_directory = os.path.dirname(os.path.abspath(args.app))
+    # the apps import their sibling modules and read products.json relative to their directory
+    sys.path.insert(0, app_directory)
+    os.chdir(app_directory)
+    if args.offline:
+        for name, value in OFFLINE_ENVIRONMENT.items():
+            os.environ.setdefault(name, value)
+        if os.path.exists(os.path.join(app_directory, "shop_resources.py")):
+            use_offline_shop()
+
+    share_script_cache()
+    app_test = AppTest.from_file(os.path.basename(args.app), default_timeout=600)
+    # the first run builds the cached resources, every later run only pays for the script itself
+    first = run(app_test)
+    reruns = [run(app_test) for _ in range(args.reruns)]
+    median = statistics.median(reruns) * 1000
+    print(f"{args.app}: first run {first * 1000:.0f}ms, reruns median {median:.1f}ms, max {max(reruns) * 1000:.1f}ms, budget {args.budget_ms:.0f}ms")
+    if median > args.budget_ms:
+        print("rerun overhead is over budget, is an expensive object built outside of a st.cache_resource factory?")
+        sys.exit(1)
@@ -0,0 +1,51 @@
+import asyncio
+
+import httpx
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+URL = "https://example.openai.azure.com/openai/deployments/gpt-4o/chat/completions"
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "backoff_seconds", lambda attempt: 0.0)
+
+
+def flaky(failures, error=httpx.ConnectError):
+    calls = []
+
+    def send(request):
+        calls.append(request)
+        if len(calls) <= failures:
+            raise error("connection reset", request=request)
+        return httpx.Response(200, json={"ok": True})
+
+    return send, calls
+
+
+def test_connection_errors_are_retried():
+    send, calls = flaky(2)
+    response = RateLimiter(max_retries=3).send(httpx.Request("POST", URL, json={}), send)
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+def test_connection_errors_are_raised_after_the_last_retry():
+    send, calls = flaky(10, httpx.ReadTimeout)
+    with pytest.raises(httpx.ReadTimeout):
+        RateLimiter(max_retries=2).send(httpx.Request("POST", URL, json={}), send)
+    assert len(calls) == 3
+
+
+def test_async_connection_errors_are_retried():
+    send, calls = flaky(1)
+
+    async def asend(request):
+        return send(request)
+
+    response = asyncio.run(RateLimiter(max_retries=3).asend(httpx.Request("POST", URL, json={}), asend))
+    assert response.status_code == 200
+    assert len(calls) == 2
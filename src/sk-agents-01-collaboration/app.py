@@ -2,6 +2,7 @@
 
 import asyncio
 import os
+import sys
 import dotenv
 import copy
 import pyperclip # Install via pip
@@ -20,6 +21,10 @@ from semantic_kernel.functions.kernel_function_decorator import kernel_function
 from semantic_kernel.functions.kernel_function_from_prompt import KernelFunctionFromPrompt
 from semantic_kernel.kernel import Kernel
 
+# the shared client factory lives next to the samples in src/shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import llm_clients
+
 ###################################################################
 # The following sample demonstrates how to create a simple,       #
 # agent group chat that utilizes a Reviewer Chat Completion       #
@@ -47,6 +52,7 @@ def _create_kernel_with_chat_completion(service_id: str) -> Kernel:
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"), # Used to point to your service
         service_id=service_id, # Optional; for targeting specific services within Semantic Kernel
+        async_client=llm_clients.async_azure_openai_client(), # every kernel shares one pooled client
     )
 
     kernel = Kernel()
@@ -1,5 +1,6 @@
 # Copyright (c) Microsoft. All rights reserved.
 import os
+import sys
 import dotenv
 import asyncio
 from typing import Annotated
@@ -12,6 +13,10 @@ from semantic_kernel.contents.utils.author_role import AuthorRole
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
 from semantic_kernel.kernel import Kernel
 
+# the shared client factory lives next to the samples in src/shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import llm_clients
+
 ###################################################################
 # The following sample demonstrates how to create a simple,       #
 # non-group agent that utilizes plugins defined as part of        #
@@ -79,6 +84,7 @@ async def main():
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"), # Used to point to your service
         service_id=service_id, # Optional; for targeting specific services within Semantic Kernel
+        async_client=llm_clients.async_azure_openai_client(), # every kernel shares one pooled client
     )
     kernel.add_service(chat_completion_service)
 
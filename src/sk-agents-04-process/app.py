@@ -1,5 +1,6 @@
 # Copyright (c) Microsoft. All rights reserved.
 import os
+import sys
 import dotenv
 import asyncio
 from enum import Enum
@@ -20,6 +21,10 @@ from semantic_kernel.processes.local_runtime.local_event import KernelProcessEve
 from semantic_kernel.processes.local_runtime.local_kernel_process import start
 from semantic_kernel.processes.process_builder import ProcessBuilder
 
+# the shared client factory lives next to the samples in src/shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import llm_clients
+
 dotenv.load_dotenv()
 
 class CommonEvents(Enum):
@@ -154,6 +159,7 @@ async def step01_processes():
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"), # Used to point to your service
         service_id="default", # Optional; for targeting specific services within Semantic Kernel
+        async_client=llm_clients.async_azure_openai_client(), # every kernel shares one pooled client
     )
     kernel.add_service(chat_completion_service)
 